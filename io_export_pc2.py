@@ -0,0 +1,294 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+bl_info = {
+    "name": "Export Pointcache Format (.pc2)",
+    "description": "Export the (selected) mesh objects as .pc2 pointcaches.",
+    "author": "jasperge",
+    "version": (0, 1),
+    "blender": (2, 7, 0),
+    "location": "File > Export > Pointcaches (.pc2)",
+    "wiki_url": "",
+    "tracker_url": "",
+    "category": "Import-Export"}
+
+
+import bpy
+from bpy.types import Operator
+from bpy.props import BoolProperty, IntProperty, StringProperty
+from bpy_extras.io_utils import ExportHelper
+from os import path
+from struct import pack
+from time import time
+
+import numpy as np
+
+
+# Header of a .pc2 file: signature, file version, number of points, start
+# frame, sample rate and number of samples.
+PC2_HEADER_FORMAT = '<12siiffi'
+PC2_NUM_SAMPLES_OFFSET = 28
+
+# Size of the write buffer of every .pc2 file.
+PC2_BUFFER_SIZE = 2 ** 20
+
+
+class Pc2Writer(object):
+    """
+    Pc2Writer(filepath, num_points, startframe=0.0, samplerate=1.0)
+
+        Writes a .pc2 point cache one sample at a time through a buffered
+        file, so only one frame has to be in memory. The number of samples
+        in the header is written when the file is closed.
+    """
+
+    def __init__(self, filepath, num_points, startframe=0.0, samplerate=1.0):
+        self.num_points = num_points
+        self.num_samples = 0
+        self.__file = open(filepath, 'wb', buffering=PC2_BUFFER_SIZE)
+        self.__file.write(pack(PC2_HEADER_FORMAT, b'POINTCACHE2\0', 1,
+                num_points, startframe, samplerate, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_sample(self, vertexarray):
+        """
+        write_sample(vertexarray)
+
+            Appends the positions of all points (an array of shape
+            (num_points, 3)) as the next sample.
+        """
+
+        vertexarray = np.asarray(vertexarray)
+        if vertexarray.shape != (self.num_points, 3):
+            raise ValueError("The sample should have {} points, not {}.".
+                    format(self.num_points, len(vertexarray)))
+        # No copy for float32 data on little endian machines.
+        self.__file.write(np.ascontiguousarray(vertexarray, dtype='<f4'))
+        self.num_samples += 1
+
+    def close(self):
+        """
+        close()
+
+            Writes the number of samples in the header and closes the file.
+        """
+
+        if self.__file.closed:
+            return
+        try:
+            self.__file.seek(PC2_NUM_SAMPLES_OFFSET)
+            self.__file.write(pack('<i', self.num_samples))
+        finally:
+            self.__file.close()
+
+
+class MeshReader(object):
+    """
+    MeshReader(ob, scene, apply_modifiers=True)
+
+        Reads the vertex positions of the evaluated mesh of an object. The
+        positions are read in bulk with 'foreach_get' in a buffer that is
+        reused for every frame. The number of vertices is taken from the
+        first frame, 'read' raises a ValueError if it changes.
+    """
+
+    def __init__(self, ob, scene, apply_modifiers=True):
+        self.ob = ob
+        self.__scene = scene
+        self.__apply_modifiers = apply_modifiers
+        self.num_vertices = None
+        self.__buffer = None
+
+    def read(self):
+        """
+        read()
+
+            Returns the positions of the vertices at the current frame as an
+            array of shape (num_vertices, 3). The array is overwritten by
+            the next call.
+        """
+
+        me = self.ob.to_mesh(self.__scene, self.__apply_modifiers,
+                'PREVIEW')
+        try:
+            num_vertices = len(me.vertices)
+            if self.__buffer is None:
+                self.num_vertices = num_vertices
+                self.__buffer = np.empty(num_vertices * 3, dtype=np.float32)
+            elif num_vertices != self.num_vertices:
+                raise ValueError("The number of vertices of '{}' changed "\
+                        "from {} to {} at frame {}.".format(self.ob.name,
+                                self.num_vertices, num_vertices,
+                                self.__scene.frame_current))
+            me.vertices.foreach_get("co", self.__buffer)
+        finally:
+            bpy.data.meshes.remove(me)
+
+        return self.__buffer.reshape(-1, 3)
+
+
+def cache_filepath(directory, ob):
+    """
+    cache_filepath(directory, ob)
+
+        Returns the path of the .pc2 file of an object. The file is named
+        after the object, so 'io_import_caches' matches it again.
+    """
+
+    return path.join(directory, "{}.pc2".format(
+            ob.name.replace("/", "_").replace("\\", "_")))
+
+
+def export_pc2(scene, directory, objects, frame_start, frame_end,
+        frame_step=1, apply_modifiers=True):
+    """
+    export_pc2(scene, directory, objects, frame_start, frame_end,
+               frame_step=1, apply_modifiers=True)
+
+        Writes the vertex positions of every object in 'objects' to its own
+        .pc2 file in 'directory'. The scene is stepped through the frame
+        range only once, at every frame all objects are read and appended
+        to their files. The current frame of the scene is restored
+        afterwards. Returns the paths of the written files.
+    """
+
+    readers = [MeshReader(ob, scene, apply_modifiers) for ob in objects]
+    frames = range(frame_start, frame_end + 1, frame_step)
+    frame_current = scene.frame_current
+    writers = []
+    try:
+        scene.frame_set(frames[0])
+        # The first frame gives the number of points of the caches.
+        vertexarrays = [reader.read() for reader in readers]
+        for (ob, vertexarray) in zip(objects, vertexarrays):
+            writers.append(Pc2Writer(cache_filepath(directory, ob),
+                    len(vertexarray), frame_start, frame_step))
+            writers[-1].write_sample(vertexarray)
+        for frame in frames[1:]:
+            scene.frame_set(frame)
+            for (reader, writer) in zip(readers, writers):
+                writer.write_sample(reader.read())
+    finally:
+        for writer in writers:
+            writer.close()
+        scene.frame_set(frame_current)
+
+    return [cache_filepath(directory, ob) for ob in objects]
+
+
+class ExportPc2(Operator, ExportHelper):
+    """Exports the (selected) mesh objects as .pc2 pointcaches."""
+
+    bl_idname = "export_shape.pc2"
+    bl_label = "Export pointcaches (.pc2)"
+
+    filename_ext = ".pc2"
+    filter_glob = StringProperty(
+        default="*.pc2",
+        options={'HIDDEN'},
+        )
+
+    use_selection = BoolProperty(
+        name="Selection Only",
+        description="Export selected objects only",
+        default=True,
+        )
+    apply_modifiers = BoolProperty(
+        name="Apply Modifiers",
+        description="Apply the modifiers",
+        default=True,
+        )
+    frame_start = IntProperty(
+        name="Start Frame",
+        description="First frame to export",
+        default=1,
+        )
+    frame_end = IntProperty(
+        name="End Frame",
+        description="Last frame to export",
+        default=250,
+        )
+    frame_step = IntProperty(
+        name="Frame Step",
+        description="Number of frames between two samples",
+        min=1, default=1,
+        )
+
+    def invoke(self, context, event):
+        self.frame_start = context.scene.frame_start
+        self.frame_end = context.scene.frame_end
+
+        return ExportHelper.invoke(self, context, event)
+
+    def execute(self, context):
+
+        time1 = time()
+
+        if self.use_selection:
+            objects = context.selected_objects
+        else:
+            objects = context.scene.objects
+        objects = [ob for ob in objects if ob.type == 'MESH']
+        if not objects:
+            self.report({'ERROR'}, "No mesh objects to export")
+            return {'CANCELLED'}
+        if self.frame_end < self.frame_start:
+            self.report({'ERROR'}, "The end frame is before the start frame")
+            return {'CANCELLED'}
+
+        try:
+            filepaths = export_pc2(context.scene,
+                    path.dirname(self.filepath), objects, self.frame_start,
+                    self.frame_end, self.frame_step, self.apply_modifiers)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        print("\n*** Exported {} pointcaches in {:.2f} seconds...\n".format(
+                len(filepaths), time() - time1))
+        self.report({'INFO'}, "Exported {} objects, frames {} - {}".format(
+                len(objects), self.frame_start, self.frame_end))
+
+        return {'FINISHED'}
+
+
+def menu_func_export(self, context):
+    self.layout.operator(ExportPc2.bl_idname, text="Pointcaches (.pc2)")
+
+
+def register():
+    bpy.utils.register_module(__name__)
+
+    bpy.types.INFO_MT_file_export.append(menu_func_export)
+
+
+def unregister():
+    bpy.utils.unregister_module(__name__)
+
+    bpy.types.INFO_MT_file_export.remove(menu_func_export)
+
+
+if __name__ == "__main__":
+    register()
@@ -19,12 +19,13 @@
 # <pep8 compliant>
 
 bl_info = {
-    "name": "Import Maya Cache (.xml, .mc)",
+    "name": "Import-Export Maya Cache (.xml, .mc)",
     "author": "Jasper van Nieuwenhuizen",
     "version": (0, 1),
-    "blender": (2, 6, 0),
-    "location": "File > Import > Maya cache (.xml, .mc)",
-    "description": "Imports Maya Cache to Objects",
+    "blender": (2, 7, 0),
+    "location": "File > Import-Export > Maya cache (.xml, .mc)",
+    "description": "Imports Maya Cache to Objects and exports Objects to"\
+            " Maya Cache",
     "warning": "wip",
     "wiki_url": "",
     "tracker_url": "",
@@ -32,6 +33,8 @@ bl_info = {
 
 if "bpy" in locals():
     import imp
+    if "mayacache" in locals():
+        imp.reload(mayacache)
     if "import_mc" in locals():
         imp.reload(import_mc)
     if "export_mc" in locals():
@@ -39,8 +42,11 @@ if "bpy" in locals():
 
 
 import bpy
+from bpy.app.handlers import persistent
 from bpy.props import (BoolProperty,
+                       CollectionProperty,
                        FloatProperty,
+                       IntProperty,
                        StringProperty,
                        EnumProperty,
                        )
@@ -57,9 +63,19 @@ class ImportMC(bpy.types.Operator, ImportHelper):
     bl_label = "Import Maya Cache"
     bl_options = {'PRESET', 'UNDO'}
 
+    directory = StringProperty(
+            maxlen=1024,
+            subtype='DIR_PATH',
+            options={'HIDDEN', 'SKIP_SAVE'},
+            )
+    files = CollectionProperty(
+            type=bpy.types.OperatorFileListElement,
+            options={'HIDDEN', 'SKIP_SAVE'},
+            )
+
     filename_ext = ".xml"
     filter_glob = StringProperty(
-            default="*.xml;*.mc",
+            default="*.xml;*.mc;*.mcx",
             options={'HIDDEN'},
             )
 
@@ -69,6 +85,82 @@ class ImportMC(bpy.types.Operator, ImportHelper):
             default=False,
             )
 
+    use_fuzzy_match = BoolProperty(
+            name="Fuzzy Matching",
+            description="Match channels to objects with a similar name",
+            default=True,
+            )
+
+    cache_method = EnumProperty(
+            name="Import As",
+            description="How to import the cache",
+            items=(('shape', "Shapekeys", "As shapekeys"),
+                   ('mod', "Modifier", "Transcode to .pc2 and use a Mesh"\
+                    " Cache modifier"),
+                   ('live', "Live", "Read the frames from the cache while"\
+                    " playing, nothing is baked"),
+                   ),
+            default='shape',
+            )
+
+    use_relative_path = BoolProperty(
+            name="Relative Path",
+            description="Select the .pc2 files relative to the blend file",
+            default=True,
+            )
+
+    sample_stride = IntProperty(
+            name="Sample Stride",
+            description="Only import every Nth sample of the cache",
+            min=1,
+            default=1,
+            )
+
+    use_block_reads = BoolProperty(
+            name="Block Reads",
+            description="Read whole time blocks at once and read ahead"\
+                    " (faster for caches on network storage)",
+            default=False,
+            )
+
+    vertex_stride = IntProperty(
+            name="Vertex Stride",
+            description="Only read every Nth vertex of the cache, to bind"\
+                    " it to proxy objects",
+            min=1,
+            default=1,
+            )
+
+    animation_method = EnumProperty(
+            name="Animation",
+            description="How to animate the shape keys",
+            items=(('FCURVE', "F-Curves", "Build the F-Curves of all shape"\
+                    " keys at once (fast)"),
+                   ('KEYFRAME', "Keyframes", "Insert the keyframes one by"\
+                    " one (slow)"),
+                   ('EVAL_TIME', "Frame Index", "Absolute shape keys,"\
+                    " selected by one 'Evaluation Time' F-Curve (fastest"\
+                    " playback)"),
+                   ),
+            default='FCURVE',
+            )
+
+    use_static_detection = BoolProperty(
+            name="Skip Static Frames",
+            description="Use one shape key for identical frames and none"\
+                    " for frames that match the rest pose",
+            default=True,
+            )
+
+    static_tolerance = FloatProperty(
+            name="Tolerance",
+            description="Distance a vertex may move for a frame to still"\
+                    " count as static",
+            min=0.0,
+            default=0.0001,
+            precision=5,
+            )
+
     interpolation = EnumProperty(
             name="Interpolation",
             items=(('LINEAR', "Linear", ""),
@@ -101,7 +193,9 @@ class ImportMC(bpy.types.Operator, ImportHelper):
 
     frame_scale = FloatProperty(
             name="Frame Scale",
-            description="Evaluation time in seconds",
+            description="Speed of the cache (2 plays it twice as fast)",
+            min=0.0001,
+            default=1.0,
             )
 
     eval_frame = FloatProperty(
@@ -145,12 +239,17 @@ class ImportMC(bpy.types.Operator, ImportHelper):
 
     def execute(self, context):
         import imp
+        import os
         from . import import_mc
+        # 'mayacache' is not reloaded, that would clear the cache of parsed
+        # .xml files (see 'MayaCache').
         imp.reload(import_mc)
 
         keywords = self.as_keywords(ignore=("forward_axis",
                                             "up_axis",
                                             "filter_glob",
+                                            "directory",
+                                            "files",
                                             ))
 
         global_matrix = axis_conversion(from_forward=self.forward_axis,
@@ -158,15 +257,50 @@ class ImportMC(bpy.types.Operator, ImportHelper):
                                         ).to_4x4()
         keywords["global_matrix"] = global_matrix
 
+        if self.files and self.files[0].name:
+            filepaths = [os.path.join(self.directory, f.name)
+                         for f in self.files]
+        elif os.path.basename(self.filepath):
+            # A single file (e.g. from a script that only sets filepath).
+            filepaths = [self.filepath]
+        else:
+            # No files selected, import all caches in the directory.
+            directory = self.directory or os.path.dirname(self.filepath)
+            filepaths = []
+            if directory:
+                filepaths = [mc.filepath for mc in
+                             import_mc.scan_directory(directory)]
+        if not filepaths:
+            self.report({'ERROR'}, "No Maya Cache files found")
+            return {'CANCELLED'}
+        elif len(filepaths) > 1:
+            del keywords["filepath"]
+            return import_mc.load_batch(self, context, filepaths,
+                                        **keywords)
+        keywords["filepath"] = filepaths[0]
+
         return import_mc.load(self, context, **keywords)
 
     def draw(self, context):
         layout = self.layout
 
         layout.prop(self, "use_selection")
+        layout.prop(self, "use_fuzzy_match")
+        layout.prop(self, "cache_method")
+        layout.prop(self, "sample_stride")
+        layout.prop(self, "vertex_stride")
+        layout.prop(self, "use_block_reads")
+        if self.cache_method == 'mod':
+            layout.prop(self, "use_relative_path")
+        else:
+            layout.prop(self, "animation_method")
+            layout.prop(self, "use_static_detection")
+            if self.use_static_detection:
+                layout.prop(self, "static_tolerance")
 
         layout.label(text="Time Mapping:")
 
+        layout.prop(self, "interpolation")
         row = layout.row()
         row.prop(self, "time_mode", expand=True)
         row = layout.row()
@@ -195,26 +329,160 @@ class ImportMC(bpy.types.Operator, ImportHelper):
         #row.prop(self, "flip_axis")
 
 
+class ExportMC(bpy.types.Operator, ExportHelper):
+    """Save a Maya Cache file"""
+    bl_idname = "export_shape.mc"
+    bl_label = "Export Maya Cache"
+    bl_options = {'PRESET'}
+
+    filename_ext = ".xml"
+    filter_glob = StringProperty(
+            default="*.xml",
+            options={'HIDDEN'},
+            )
+
+    use_selection = BoolProperty(
+            name="Selection Only",
+            description="Export the selected objects only",
+            default=True,
+            )
+
+    apply_modifiers = BoolProperty(
+            name="Apply Modifiers",
+            description="Export the positions of the evaluated meshes",
+            default=True,
+            )
+
+    frame_start = IntProperty(
+            name="Start Frame",
+            description="First frame to export",
+            default=1,
+            )
+
+    frame_end = IntProperty(
+            name="End Frame",
+            description="Last frame to export",
+            default=250,
+            )
+
+    cache_type = EnumProperty(
+            name="Cache Type",
+            description="Write one .mc file or one .mc file per frame",
+            items=(('OneFile', "One File", "All frames in one .mc file"),
+                   ('OneFilePerFrame', "One File Per Frame", "A .mc file"\
+                    " for every frame"),
+                   ),
+            default='OneFile',
+            )
+
+    data_format = EnumProperty(
+            name="Format",
+            description="Precision of the vertex positions",
+            items=(('FVCA', "Float", "32 bit floats"),
+                   ('DVCA', "Double", "64 bit floats"),
+                   ),
+            default='FVCA',
+            )
+
+    cache_format = EnumProperty(
+            name="File Format",
+            description="Format of the cache files",
+            items=(('mcc', "mcc", "32 bit .mc files (up to 2 GB)"),
+                   ('mcx', "mcx", "64 bit .mcx files (over 2 GB)"),
+                   ),
+            default='mcc',
+            )
+
+    def invoke(self, context, event):
+        self.frame_start = context.scene.frame_start
+        self.frame_end = context.scene.frame_end
+
+        return ExportHelper.invoke(self, context, event)
+
+    def execute(self, context):
+        import imp
+        from . import export_mc
+        imp.reload(export_mc)
+
+        keywords = self.as_keywords(ignore=("filter_glob",
+                                            "check_existing",
+                                            ))
+
+        return export_mc.save(self, context, **keywords)
+
+
+class StopLiveMC(bpy.types.Operator):
+    """Stop playing the live Maya Caches and restore the meshes"""
+    bl_idname = "import_shape.mc_stop_live"
+    bl_label = "Stop Live Maya Caches"
+
+    @classmethod
+    def poll(cls, context):
+        from . import import_mc
+        return bool(import_mc.live_caches())
+
+    def execute(self, context):
+        from . import import_mc
+        import_mc.stop_live_caches()
+
+        return {'FINISHED'}
+
+
+# The live caches are not saved with the .blend file: the meshes are restored
+# while saving, and the caches are stopped (and closed) before another file
+# is loaded.
+@persistent
+def live_caches_save_pre(dummy):
+    from . import import_mc
+    import_mc.restore_live_caches()
+
+
+@persistent
+def live_caches_save_post(dummy):
+    from . import import_mc
+    import_mc.update_live_caches(bpy.context.scene)
+
+
+@persistent
+def live_caches_load_pre(dummy):
+    from . import import_mc
+    import_mc.stop_live_caches()
+
+
 def menu_func_import(self, context):
     self.layout.operator(ImportMC.bl_idname, text="Maya Cache (.xml, .mc)")
+    if StopLiveMC.poll(context):
+        self.layout.operator(StopLiveMC.bl_idname,
+                             text="Stop Live Maya Caches")
 
 
-#def menu_func_export(self, context):
-#    self.layout.operator(ExportMC.bl_idname, text="Maya Cache (.xml, .mc)")
+def menu_func_export(self, context):
+    self.layout.operator(ExportMC.bl_idname, text="Maya Cache (.xml, .mc)")
 
 
 def register():
     bpy.utils.register_module(__name__)
 
     bpy.types.INFO_MT_file_import.append(menu_func_import)
-    #bpy.types.INFO_MT_file_export.append(menu_func_export)
+    bpy.types.INFO_MT_file_export.append(menu_func_export)
+
+    bpy.app.handlers.save_pre.append(live_caches_save_pre)
+    bpy.app.handlers.save_post.append(live_caches_save_post)
+    bpy.app.handlers.load_pre.append(live_caches_load_pre)
 
 
 def unregister():
+    from . import import_mc
+    import_mc.stop_live_caches()
+
+    bpy.app.handlers.save_pre.remove(live_caches_save_pre)
+    bpy.app.handlers.save_post.remove(live_caches_save_post)
+    bpy.app.handlers.load_pre.remove(live_caches_load_pre)
+
     bpy.utils.unregister_module(__name__)
 
     bpy.types.INFO_MT_file_import.remove(menu_func_import)
-    #bpy.types.INFO_MT_file_export.remove(menu_func_export)
+    bpy.types.INFO_MT_file_export.remove(menu_func_export)
 
 if __name__ == "__main__":
     register()
@@ -0,0 +1,193 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Benchmark of the Maya Cache reader.
+
+Generates a synthetic Maya Cache and times parsing the header, scanning the
+.mc file(s), random access to single channels and decoding all frames. Runs
+outside of Blender (only NumPy is needed):
+
+    python io_import_mc/benchmark_mc.py --vertices 100000 --frames 100
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import mayacache
+
+
+def generate_cache(filepath, num_channels, num_vertices, num_frames,
+        dataformat="FVCA", cachetype="OneFile", cacheformat="mcc",
+        timeperframe=250, seed=0):
+    """
+    generate_cache(filepath, num_channels, num_vertices, num_frames,
+                   dataformat="FVCA", cachetype="OneFile", cacheformat="mcc",
+                   timeperframe=250, seed=0)
+
+        Writes a Maya Cache with 'num_channels' channels of 'num_vertices'
+        vertices and 'num_frames' frames (starting at frame 1) with random
+        positions. The same 'seed' gives the same cache.
+        Returns the size of the vertex data in bytes.
+    """
+
+    rng = np.random.RandomState(seed)
+    channels = [("pSphereShape{}".format(i + 1), num_vertices)
+            for i in range(num_channels)]
+    starttime = timeperframe
+    endtime = num_frames * timeperframe
+    with mayacache.MayaCacheWriter(filepath, channels, starttime, endtime,
+            timeperframe, cachetype, dataformat, cacheformat) as writer:
+        for ticks in range(starttime, endtime + 1, timeperframe):
+            writer.write_frame(ticks, {channelname:
+                    rng.uniform(-10, 10, (num_vertices, 3))
+                    for (channelname, _) in channels})
+
+    return (num_channels * num_vertices * num_frames * 3 *
+            mayacache.DATAFORMAT_SIZES[dataformat])
+
+
+def best_time(function, repeat):
+    """
+    best_time(function, repeat)
+
+        Calls 'function' 'repeat' times and returns the fastest time in
+        seconds.
+    """
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def bench_header(filepath):
+    mayacache._xmlfile_cache.clear()
+    mayacache.MayaCache(filepath)
+
+
+def bench_scan(filepath, use_block_reads):
+    with mayacache.MayaCache(filepath,
+            use_block_reads=use_block_reads) as cache:
+        cache.index
+
+
+def bench_random_access(filepath, lookups, use_mmap):
+    with mayacache.MayaCache(filepath, use_mmap=use_mmap) as cache:
+        for (channel, cachetime) in lookups:
+            cache.read_channel_at_time(channel=channel, cachetime=cachetime)
+
+
+def bench_decode(filepath, use_mmap, use_block_reads=False):
+    with mayacache.MayaCache(filepath, use_mmap=use_mmap,
+            use_block_reads=use_block_reads) as cache:
+        for (_, channels) in cache.iter_frames():
+            for positions in channels.values():
+                if use_mmap or use_block_reads:
+                    mayacache.native_vertices(positions)
+                else:
+                    # Without mmap the positions are a generator of tuples.
+                    list(positions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vertices", type=int, default=10000,
+            help="number of vertices per channel")
+    parser.add_argument("--channels", type=int, default=4,
+            help="number of channels")
+    parser.add_argument("--frames", type=int, default=100,
+            help="number of frames")
+    parser.add_argument("--format", choices=sorted(
+            mayacache.DATAFORMAT_SIZES), default="FVCA",
+            help="data format of the vertices")
+    parser.add_argument("--cachetype", choices=("OneFile",
+            "OneFilePerFrame"), default="OneFile")
+    parser.add_argument("--cacheformat", choices=sorted(
+            mayacache.BLOCK_FORMATS), default="mcc",
+            help="32 bit (.mc) or 64 bit (.mcx) data files")
+    parser.add_argument("--lookups", type=int, default=200,
+            help="number of random channel reads")
+    parser.add_argument("--repeat", type=int, default=3,
+            help="number of runs per benchmark, the fastest is reported")
+    parser.add_argument("--directory",
+            help="directory for the cache (default: a temporary directory "
+                 "that is removed afterwards)")
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp(prefix="benchmark_mc")
+    try:
+        filepath = os.path.join(directory, "benchmark.xml")
+        start = time.perf_counter()
+        datasize = generate_cache(filepath, args.channels, args.vertices,
+                args.frames, args.format, args.cachetype, args.cacheformat)
+        print("Generated {} {} cache ({:.1f} MB of vertex data) in {:.3f} s".
+                format(args.cacheformat, args.cachetype, datasize / 2 ** 20,
+                        time.perf_counter() - start))
+
+        cache = mayacache.MayaCache(filepath)
+        rng = random.Random(0)
+        lookups = [(rng.choice(cache.channels), rng.randint(cache.startframe,
+                cache.endframe) * cache.timeperframe)
+                for _ in range(args.lookups)]
+
+        results = [
+            ("Parse header", best_time(lambda: bench_header(filepath),
+                    args.repeat), None),
+            ("Scan (build index)", best_time(lambda: bench_scan(filepath,
+                    False), args.repeat), None),
+            ("Scan (block reads)", best_time(lambda: bench_scan(filepath,
+                    True), args.repeat), None)]
+        for use_mmap in (False, True):
+            label = " (mmap)" if use_mmap else ""
+            results.append(("Random access{}".format(label),
+                    best_time(lambda: bench_random_access(filepath, lookups,
+                            use_mmap), args.repeat), None))
+            results.append(("Decode all frames{}".format(label),
+                    best_time(lambda: bench_decode(filepath, use_mmap),
+                            args.repeat), datasize))
+        results.append(("Decode all (block reads)", best_time(
+                lambda: bench_decode(filepath, False, True), args.repeat),
+                datasize))
+
+        for (label, seconds, size) in results:
+            line = "{:<26}{:>10.2f} ms".format(label, seconds * 1000)
+            if size:
+                line += "{:>10.1f} MB/s".format(size / 2 ** 20 / seconds)
+            elif label.startswith("Random access"):
+                line += "{:>10.1f} us/read".format(seconds * 1e6 /
+                        max(1, len(lookups)))
+            print(line)
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
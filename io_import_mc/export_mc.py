@@ -0,0 +1,172 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+import bpy
+
+import numpy as np
+
+from .mayacache import MayaCacheWriter
+
+
+def channel_name(ob):
+    """
+    channel_name(ob)
+
+        Returns the Maya channel name for the object: the name of the shape
+        node Maya would give it ('Cube.001' > 'Cube_001Shape'). Maya names
+        can only contain letters, digits and underscores.
+    """
+
+    return "".join((bpy.path.clean_name(ob.name), "Shape"))
+
+
+def ticks_per_frame(scene):
+    """
+    ticks_per_frame(scene)
+
+        Returns the length of a frame of the scene in Maya ticks (there are
+        6000 ticks in a second, so 250 ticks per frame at 24 fps).
+    """
+
+    return int(round(6000 * scene.render.fps_base / scene.render.fps))
+
+
+class MeshReader(object):
+    """
+    MeshReader(ob, scene, apply_modifiers=True)
+
+        Reads the vertex positions of the evaluated mesh of an object. The
+        positions are read in bulk with 'foreach_get' in a buffer that is
+        reused for every frame. The number of vertices is taken from the
+        current frame, 'read' raises a ValueError if it changes.
+    """
+
+    def __init__(self, ob, scene, apply_modifiers=True):
+        self.ob = ob
+        self.channelname = channel_name(ob)
+        self.__scene = scene
+        self.__apply_modifiers = apply_modifiers
+        self.num_vertices = None
+        self.__buffer = None
+
+    def read(self):
+        """
+        read()
+
+            Returns the positions of the vertices at the current frame as an
+            array of shape (num_vertices, 3). The array is overwritten by
+            the next call.
+        """
+
+        me = self.ob.to_mesh(self.__scene, self.__apply_modifiers,
+                'PREVIEW')
+        try:
+            num_vertices = len(me.vertices)
+            if self.__buffer is None:
+                self.num_vertices = num_vertices
+                self.__buffer = np.empty(num_vertices * 3, dtype=np.float32)
+            elif num_vertices != self.num_vertices:
+                raise ValueError("The number of vertices of '{}' changed "\
+                        "from {} to {} at frame {}.".format(self.ob.name,
+                                self.num_vertices, num_vertices,
+                                self.__scene.frame_current))
+            me.vertices.foreach_get("co", self.__buffer)
+        finally:
+            bpy.data.meshes.remove(me)
+
+        return self.__buffer.reshape(-1, 3)
+
+
+def export_cache(scene, filepath, objects, frame_start, frame_end,
+        cache_type='OneFile', data_format='FVCA', cache_format='mcc',
+        apply_modifiers=True):
+    """
+    export_cache(scene, filepath, objects, frame_start, frame_end,
+                 cache_type='OneFile', data_format='FVCA', cache_format='mcc',
+                 apply_modifiers=True)
+
+        Writes the vertex positions of 'objects' from 'frame_start' to
+        'frame_end' to a Maya Cache. The scene is stepped through the frame
+        range only once, at every frame all objects are read and the time
+        block is written in one go. The current frame of the scene is
+        restored afterwards.
+    """
+
+    readers = [MeshReader(ob, scene, apply_modifiers) for ob in objects]
+    timeperframe = ticks_per_frame(scene)
+    frame_current = scene.frame_current
+    try:
+        scene.frame_set(frame_start)
+        # The first frame gives the number of vertices of the channels.
+        vertexarrays = {r.channelname: r.read() for r in readers}
+        channels = [(r.channelname, r.num_vertices) for r in readers]
+        with MayaCacheWriter(filepath, channels,
+                frame_start * timeperframe, frame_end * timeperframe,
+                timeperframe, cache_type, data_format,
+                cache_format) as writer:
+            writer.write_frame(frame_start * timeperframe, vertexarrays)
+            for frame in range(frame_start + 1, frame_end + 1):
+                scene.frame_set(frame)
+                writer.write_frame(frame * timeperframe,
+                        {r.channelname: r.read() for r in readers})
+    finally:
+        scene.frame_set(frame_current)
+
+
+def save(operator, context, filepath="", use_selection=True, frame_start=1,
+        frame_end=250, cache_type='OneFile', data_format='FVCA',
+        cache_format='mcc', apply_modifiers=True):
+    """
+    save(operator, context, filepath="", use_selection=True, frame_start=1,
+         frame_end=250, cache_type='OneFile', data_format='FVCA',
+         cache_format='mcc', apply_modifiers=True)
+
+        Exports the (selected) mesh objects to a Maya Cache.
+    """
+
+    if use_selection:
+        objects = context.selected_objects
+    else:
+        objects = context.scene.objects
+    objects = [ob for ob in objects if ob.type == 'MESH']
+    if not objects:
+        operator.report({'ERROR'}, "No mesh objects to export")
+        return {'CANCELLED'}
+    if frame_end < frame_start:
+        operator.report({'ERROR'}, "The end frame is before the start frame")
+        return {'CANCELLED'}
+    channelnames = [channel_name(ob) for ob in objects]
+    if len(set(channelnames)) != len(channelnames):
+        operator.report({'ERROR'}, "Objects with the same channel name: "\
+                "{}".format(", ".join(sorted(set(name for name in
+                        channelnames if channelnames.count(name) > 1)))))
+        return {'CANCELLED'}
+
+    try:
+        export_cache(context.scene, filepath, objects, frame_start,
+                frame_end, cache_type, data_format, cache_format,
+                apply_modifiers)
+    except ValueError as e:
+        operator.report({'ERROR'}, str(e))
+        return {'CANCELLED'}
+    operator.report({'INFO'}, "Exported {} objects, frames {} - {}".format(
+            len(objects), frame_start, frame_end))
+
+    return {'FINISHED'}
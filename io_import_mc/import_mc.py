@@ -20,589 +20,1376 @@
 
 import bpy
 
-from array import array
+import bisect
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import difflib
 import itertools
+import math
 import os
-from struct import unpack
-import sys
-import xml.etree.ElementTree as ET
+import queue
+import re
+from struct import pack
+import threading
 
+import numpy as np
 
-class MayaCache(object):
+from .mayacache import (READ_WORKERS, MayaCache, native_vertices,
+                        raise_cachefile_error, scan_directory, vertex_indices)
+
+
+# Header of a .pc2 file: signature, file version, number of points, start
+# frame, sample rate and number of samples.
+PC2_HEADER_FORMAT = "<12siiffi"
+PC2_NUM_SAMPLES_OFFSET = 28
+
+# Size of the write buffer of a .pc2 file.
+PC2_BUFFER_SIZE = 2 ** 20
+
+# The 'Shape' suffix Maya adds to the name of a shape node, optionally
+# followed by the number of the transform ('pCubeShape1' for 'pCube1').
+SHAPE_SUFFIX = re.compile(r"Shape(\d*)$")
+
+# Minimal similarity (0 - 1) of names for a fuzzy channel match.
+FUZZY_CUTOFF = 0.8
+
+# The numbers in a name, names with different numbers ('agent12' and
+# 'agent13') are never matched fuzzily.
+NAME_NUMBERS = re.compile(r"\d+")
+
+# Result of matching the channels with the objects.
+ChannelMatches = namedtuple("ChannelMatches",
+        "matches unmatched ambiguous fuzzy")
+
+# Number of decoded frames kept in memory by a live cache and the number of
+# frames it reads ahead.
+LIVE_CACHE_SIZE = 32
+LIVE_PREFETCH = 8
+
+# Default distance a vertex may move for a frame to still count as static.
+STATIC_TOLERANCE = 0.0001
+
+# Properties of the Mesh Cache modifier that are set from the import
+# settings as they are.
+MODIFIER_TIME_SETTINGS = ("time_mode", "play_mode", "eval_frame",
+        "eval_time", "eval_factor", "interpolation")
+
+# Name of the object property with the vertex indices of the channel a
+# proxy object is bound to.
+PROXY_INDICES_PROPERTY = "mc_vertex_indices"
+
+
+def normalize_name(name, strip_namespace=True):
     """
-    MayaCache(filepath)
+    normalize_name(name, strip_namespace=True)
 
-        A class to store and read all information of a Maya Cache.
-        'filepath' should be the .xml file from the Maya Cache.
+        Normalises a Maya channel name (or a Blender object name) for
+        matching: strips the DAG path ('|group|mesh' > 'mesh'), the 'Shape'
+        suffix ('meshShape' > 'mesh', 'pCubeShape1' > 'pCube1') and, if
+        'strip_namespace' is True, namespaces ('ns:mesh' > 'mesh').
     """
 
-    def __init__(self, filepath):
-        if not os.path.isfile(filepath):
-            raise_cachefile_error(2, filepath)
-        elif not os.path.splitext(filepath)[-1].lower() == ".xml":
-            raise_cachefile_error(5,
-                "The file is not a valid Maya Cache file", filepath)
-        self.__xmlfile = filepath
-        self.__name = os.path.splitext(os.path.split(filepath)[-1])[0]
-        self.__cacheinfo = self._parse_xmlfile(filepath)
-        self.__mc_filepath = self._open_mcfile()
-
-    def __str__(self):
-        prettyprint = "{line}\n"\
-                "** Maya Cache File: {self.name}.xml **\n"\
-                "{line}\n"\
-                "- Cache type: {self.cachetype}\n"\
-                "- Time per frame: {self.timeperframe}\n"\
-                "- Frames per second: {fps}\n"\
-                "- Start time: {starttime} seconds\n"\
-                "- Start frame: {startframe}\n"\
-                "- End time:  {endtime} seconds\n"\
-                "- End frame: {endframe}\n"\
-                "- Number of channels: {numchannels}".format(self=self,
-                        line="*" * (27 + len(self.name)),
-                        starttime=self._ticks_to_seconds(self.starttime),
-                        startframe=self.startframe,
-                        endtime=self._ticks_to_seconds(self.endtime),
-                        endframe=self.endframe,
-                        fps=self.fps,
-                        numchannels=self.numchannels)
-        if self.numchannels:
-            prettyprint += "\n- Channels:\n  - "
-            prettyprint += "\n  - ".join(self.channels)
-
-        return prettyprint
+    name = name.rsplit("|", 1)[-1]
+    if strip_namespace:
+        name = name.rsplit(":", 1)[-1]
 
-    @property
-    def name(self):
-        return self.__name
+    return SHAPE_SUFFIX.sub(r"\1", name)
 
-    @property
-    def cachetype(self):
-        return self.__cacheinfo['cachetype']
 
-    @property
-    def timeperframe(self):
-        return self.__cacheinfo['timeperframe']
+def match_channels(channels, objects, fuzzy=True):
+    """
+    match_channels(channels, objects, fuzzy=True)
 
-    @property
-    def fps(self):
-        return 6000 / self.timeperframe
+        Try to find the matching objects for the channelnames.
+        Indices of the normalised object names (see 'normalize_name'), with
+        and without namespaces, are built once. The channels are looked up
+        in them pass by pass: exact with the namespace, exact without it
+        and then the same case insensitive (so 'agent1:bodyShape' matches
+        'agent1:body', or 'body' if there is no such object). Only the
+        channels that are left after all passes are then (if 'fuzzy' is
+        True) matched by the closest similar name of the objects that are
+        left, names with different numbers in them are never similar.
+        Returns a ChannelMatches tuple with the matches as a dictionary
+        ({<object>: <channel>}), the list of channels that could not be
+        matched, the list of channels that matched more than one object
+        (or an object that was already matched by another channel) and the
+        list of channels that were matched fuzzily.
+    """
 
-    @property
-    def starttime(self):
-        return self.__cacheinfo['cachestarttime']
+    def match_keys(name):
+        qualified = normalize_name(name, strip_namespace=False)
+        name = normalize_name(name)
+        return (qualified, name, qualified.lower(), name.lower())
 
-    @property
-    def startframe(self):
-        return int(self._ticks_to_frames(self.starttime))
+    indices = [dict() for _ in range(4)]
+    for ob in objects:
+        for (index, key) in zip(indices, match_keys(ob.name)):
+            index.setdefault(key, []).append(ob)
 
-    @property
-    def endtime(self):
-        return self.__cacheinfo['cacheendtime']
+    objects_channels_match = dict()
+    unmatched = []
+    ambiguous = []
+    fuzzy_matched = []
+
+    def add_match(ch, candidates):
+        if len(candidates) > 1 or candidates[0] in objects_channels_match:
+            ambiguous.append(ch)
+            return False
+        objects_channels_match[candidates[0]] = ch
+        return True
+
+    leftover = [(ch, match_keys(ch)) for ch in channels]
+    for (i, index) in enumerate(indices):
+        channels_keys = leftover
+        leftover = []
+        for (ch, keys) in channels_keys:
+            candidates = index.get(keys[i])
+            if candidates:
+                add_match(ch, candidates)
+            else:
+                leftover.append((ch, keys))
+
+    if fuzzy and leftover:
+        # Only the objects that are not matched yet, by their lower case
+        # name with and without namespace.
+        fuzzy_indices = [dict(), dict()]
+        for ob in objects:
+            if ob not in objects_channels_match:
+                for (index, key) in zip(fuzzy_indices,
+                        match_keys(ob.name)[2:]):
+                    index.setdefault(key, []).append(ob)
+    for (ch, keys) in leftover:
+        candidates = None
+        if fuzzy:
+            for (index, key) in zip(fuzzy_indices, keys[2:]):
+                numbers = NAME_NUMBERS.findall(key)
+                names = [name for name in index
+                        if NAME_NUMBERS.findall(name) == numbers]
+                close_names = difflib.get_close_matches(key, names, n=2,
+                        cutoff=FUZZY_CUTOFF)
+                if close_names:
+                    candidates = [ob for close_name in close_names
+                            for ob in index[close_name]]
+                    break
+        if candidates:
+            if add_match(ch, candidates):
+                fuzzy_matched.append(ch)
+        else:
+            unmatched.append(ch)
 
-    @property
-    def endframe(self):
-        return int(self._ticks_to_frames(self.endtime))
+    return ChannelMatches(objects_channels_match, unmatched, ambiguous,
+            fuzzy_matched)
 
-    @property
-    def numchannels(self):
-        return len(self.__cacheinfo['channels'])
+
+def shape_keys_action(shape_keys):
+    """
+    shape_keys_action(shape_keys)
+
+        Returns the action of 'shape_keys', a new one is created if there is
+        none.
+    """
+
+    if shape_keys.animation_data is None:
+        shape_keys.animation_data_create()
+    action = shape_keys.animation_data.action
+    if action is None:
+        action = bpy.data.actions.new(name="{}Action".format(shape_keys.name))
+        shape_keys.animation_data.action = action
+
+    return action
+
+
+def has_relative_shape_keys(ob):
+    """
+    has_relative_shape_keys(ob)
+
+        Returns True if the mesh of 'ob' has relative key blocks other than
+        the reference key (the rest pose).
+    """
+
+    shape_keys = ob.data.shape_keys
+    return (shape_keys is not None and shape_keys.use_relative and
+            len(shape_keys.key_blocks) > 1)
+
+
+def add_shape_key_fcurves(shape_keys, keys):
+    """
+    add_shape_key_fcurves(shape_keys, keys)
+
+        Builds the 'value' F-Curves of the key blocks directly in the action
+        of 'shape_keys', without changing frames or inserting keyframes one
+        by one. 'keys' is a list of (<key block>, [(frame, value), ...]).
+    """
+
+    action = shape_keys_action(shape_keys)
+    for (key_block, points) in keys:
+        fcurve = action.fcurves.new(key_block.path_from_id("value"))
+        fcurve.keyframe_points.add(len(points))
+        fcurve.keyframe_points.foreach_set("co",
+                [c for point in points for c in point])
+        fcurve.update()
+
+
+def add_eval_time_fcurve(shape_keys, runs):
+    """
+    add_eval_time_fcurve(shape_keys, runs)
+
+        Animates the absolute shape keys with a single F-Curve on
+        'eval_time', which selects the key block of each run of frames
+        ([<key block>, <first frame>, <last frame>], see
+        'import_shape_keys'). Runs without a key block get the reference key
+        (the rest pose). Between two runs with (consecutive) key blocks the
+        F-Curve is linear, so subframes blend the two frames. A jump from or
+        to the rest pose is constant, as it would pass through all key
+        blocks in between. The 'eval_time' F-Curve of an earlier import is
+        replaced.
+    """
+
+    shape_keys.use_relative = False
+    reference_frame = shape_keys.reference_key.frame
+    points = []
+    interpolations = []
+    for (i, (key_block, first, last)) in enumerate(runs):
+        value = reference_frame if key_block is None else key_block.frame
+        points.append((first, value))
+        interpolations.append('LINEAR')
+        if last != first:
+            points.append((last, value))
+            interpolations.append('LINEAR')
+        if i + 1 < len(runs) and (key_block is None or
+                runs[i + 1][0] is None):
+            interpolations[-1] = 'CONSTANT'
+
+    action = shape_keys_action(shape_keys)
+    fcurve = action.fcurves.find("eval_time")
+    if fcurve is not None:
+        action.fcurves.remove(fcurve)
+    fcurve = action.fcurves.new("eval_time")
+    fcurve.keyframe_points.add(len(points))
+    fcurve.keyframe_points.foreach_set("co",
+            [c for point in points for c in point])
+    for (keyframe_point, interpolation) in zip(fcurve.keyframe_points,
+            interpolations):
+        keyframe_point.interpolation = interpolation
+    fcurve.update()
+
+
+class Pc2Writer(object):
+    """
+    Pc2Writer(filepath, num_points, startframe=0.0, samplerate=1.0)
+
+        Writes a .pc2 point cache (little endian floats, frame after frame)
+        one sample at a time through a buffered file, so only one frame has
+        to be in memory. The number of samples in the header is written when
+        the file is closed.
+    """
+
+    def __init__(self, filepath, num_points, startframe=0.0, samplerate=1.0):
+        self.__num_points = num_points
+        self.__num_samples = 0
+        self.__file = open(filepath, "wb", buffering=PC2_BUFFER_SIZE)
+        self.__file.write(pack(PC2_HEADER_FORMAT, b"POINTCACHE2\0", 1,
+                num_points, startframe, samplerate, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     @property
-    def channels(self):
-        return sorted([self.__cacheinfo['channels'][k]['channelname']
-                for k in self.__cacheinfo['channels']])
+    def num_samples(self):
+        return self.__num_samples
 
-    @staticmethod
-    def _parse_xmlfile(filepath):
+    def write_sample(self, vertexarray):
         """
-        _parse_xmlfile(filepath)
+        write_sample(vertexarray)
 
-            Parses the xml file accompanying the mc file for the Maya Cache.
-            Returns all needed information as a dict.
+            Appends the positions of all points (an array of shape
+            (num_points, 3)) as the next sample.
         """
 
-        # Parse the file to a tree and get the relevant information.
-        tree = ET.parse(filepath)
-        cache = tree.getroot()
-        cachename = cache.tag
-        cachetype = cache.find("cacheType").attrib['Type']
-        cacheformat = cache.find("cacheType").attrib['Format']
-        timerange = cache.find("time").attrib['Range']
-        timerange_split = timerange.split("_")
-        if len(timerange_split) > 2:
-            raise Exception("The time range {} is not valid.".
-                    format(timerange))
-        cachestarttime = int(timerange.split("-")[0])
-        cacheendtime = int(timerange.split("-")[1])
-        timeperframe = int(cache.find("cacheTimePerFrame").
-                attrib['TimePerFrame'])
-        cacheversion = float(cache.find("cacheVersion").attrib['Version'])
-        channels = cache.find("Channels").getchildren()
-
-        # Do sanity checks for some values.
-        if cachename != "Autodesk_Cache_File":
-            raise Exception("Cache file is unsupported type {}, should be"\
-                    " 'Autodesk_Cache_File'.".format(cachename))
-        if cachetype not in ("OneFile", "OneFilePerFrame"):
-            raise Exception("Cache type is unsupported type '{}', should be "\
-                    "'OneFile' or 'OneFilePerFrame'.".format(cachetype))
-        if cacheformat != "mcc":
-            raise Exception("Cache format is unsupported format {}, should be"\
-                    " 'mcc'.".format(cacheformat))
-        if str(cacheversion) != "2.0":
-            raise Exception("Cache version {} is not supported, only version"\
-                    " 2.0 is supported.".format(cacheversion))
-
-        # Get the information per channel.
-        channels_info = dict()
-        for channel in channels:
-            channel_info = {attr.lower(): channel.attrib[attr]
-                    for attr in channel.attrib if "channel" in channel.tag}
-            channels_info[channel.tag] = channel_info
-
-        # Store all the info in the cache_info dictionary.
-        cache_info = dict()
-        cache_info['cachetype'] = cachetype
-        cache_info['cachestarttime'] = cachestarttime
-        cache_info['cacheendtime'] = cacheendtime
-        cache_info['timeperframe'] = timeperframe
-        cache_info['channels'] = channels_info
-
-        return cache_info
-
-    def _ticks_to_frames(self, ticks):
-        return ticks / self.timeperframe
-
-    def _frames_to_ticks(self, frames):
-        return frames * self.timeperframe
-
-    def _ticks_to_seconds(self, ticks):
-        return ticks / 6000
-
-    def _seconds_to_ticks(self, seconds):
-        return seconds * 6000
-
-    def _open_mcfile(self, framenumber=None):
+        vertexarray = np.asarray(vertexarray)
+        if vertexarray.shape != (self.__num_points, 3):
+            raise ValueError("The sample should have {} points, not {}.".
+                    format(self.__num_points, len(vertexarray)))
+        # No copy for float32 data on little endian machines.
+        self.__file.write(np.ascontiguousarray(vertexarray, dtype="<f4"))
+        self.__num_samples += 1
+
+    def close(self):
         """
-        _open_mcfile(framenumber=None)
+        close()
 
-            First checks the type of the Maya Cache. According to this
-            it opens the correct .mc file, checks the header and then returns
-            the open file object at the current position (after the header).
+            Writes the number of samples in the header and closes the file.
         """
 
-        # Check the cache type and get the right .mc file for this.
-        (base, _) = os.path.splitext(self.__xmlfile)
-        if self.cachetype == "OneFile":
-            mc_filepath = "".join((base, ".mc"))
-        elif self.cachetype == "OneFilePerFrame":
-            if not framenumber:
-                raise TypeError("The frame number is not specified.")
-            elif not isinstance(framenumber, int):
-                # Convert to int or raise an error.
-                try:
-                    framenumber = int(framenumber)
-                except ValueError:
-                    raise TypeError("The frame number should be an integer.")
-            mc_filepath = "".join((base,
-                    "Frame{}".format(framenumber), ".mc"))
+        if self.__file.closed:
+            return
+        try:
+            self.__file.seek(PC2_NUM_SAMPLES_OFFSET)
+            self.__file.write(pack("<i", self.__num_samples))
+        finally:
+            self.__file.close()
+
+
+def add_mesh_cache_modifier(ob, cache_filepath, frame_start=1,
+        use_relative_path=True, frame_scale=1.0, time_settings=None):
+    """
+    add_mesh_cache_modifier(ob, cache_filepath, frame_start=1,
+                            use_relative_path=True, frame_scale=1.0,
+                            time_settings=None)
+
+        Sets up a Mesh Cache modifier (at the top of the modifier stack) on
+        'ob' that reads the .pc2 file 'cache_filepath'. An existing Mesh
+        Cache modifier is reused. 'time_settings' is a dictionary with the
+        other time properties of the modifier (see
+        'MODIFIER_TIME_SETTINGS').
+    """
+
+    mc_mod = None
+    for m in ob.modifiers:
+        if m.type == "MESH_CACHE":
+            mc_mod = m
+    if not mc_mod:
+        mc_mod = ob.modifiers.new(name="Mesh Cache", type='MESH_CACHE')
+        # Move the mesh cache modifier to the top of the stack.
+        for i in range(len(ob.modifiers) - 1):
+            bpy.ops.object.modifier_move_up({"object": ob},
+                    modifier=mc_mod.name)
+    # Determine to use relative path or not.
+    if bpy.data.filepath and use_relative_path:
+        cache_filepath = bpy.path.relpath(cache_filepath)
+    mc_mod.show_render = True
+    mc_mod.show_viewport = True
+    mc_mod.cache_format = 'PC2'
+    mc_mod.filepath = cache_filepath
+    mc_mod.deform_mode = 'INTEGRATE'
+    mc_mod.frame_start = frame_start
+    mc_mod.frame_scale = frame_scale
+    for (setting, value) in (time_settings or {}).items():
+        setattr(mc_mod, setting, value)
+
+    return mc_mod
+
+
+def proxy_vertices(ob, vertex_stride=1):
+    """
+    proxy_vertices(ob, vertex_stride=1)
+
+        Returns the vertex subset of the channel that is bound to 'ob'. This
+        is the list of vertex indices in the 'mc_vertex_indices' property of
+        the object (e.g. for a decimated proxy mesh), otherwise
+        'vertex_stride' or None if all vertices should be read.
+    """
+
+    if PROXY_INDICES_PROPERTY in ob:
+        return np.array(ob[PROXY_INDICES_PROPERTY][:], dtype=np.int64)
+    if vertex_stride > 1:
+        return vertex_stride
+
+    return None
+
+
+def import_mesh_cache(mayacache, matchlist, use_relative_path=True,
+        vertices=None, sample_stride=1, frame_start=0.0, frame_scale=1.0,
+        time_settings=None):
+    """
+    import_mesh_cache(mayacache, matchlist, use_relative_path=True,
+                      vertices=None, sample_stride=1, frame_start=0.0,
+                      frame_scale=1.0, time_settings=None)
+
+        Transcodes the matched channels of the Maya Cache to one .pc2 file per
+        object (in the directory '<cache name>_pc2' next to the .xml file)
+        and sets up a Mesh Cache modifier to read it. The cache is streamed,
+        only one frame is in memory at the same time.
+        'vertices' are the vertex subsets per channel (see 'iter_frames').
+        Only every 'sample_stride'th sample is written. The time mapping
+        ('frame_start', 'frame_scale' and 'time_settings', see 'TimeMap'
+        and 'add_mesh_cache_modifier') is left to the modifier. For the
+        'FRAME' time mode its start frame and scale are set so that the
+        cache plays at the same scene frames as imported shape keys.
+    """
+
+    xml_directory = os.path.dirname(mayacache.filepath)
+    pc2_directory = os.path.join(xml_directory,
+            "{}_pc2".format(mayacache.name))
+    if not os.path.isdir(pc2_directory):
+        os.makedirs(pc2_directory)
+    frames = mayacache.iter_frames(channels=set(matchlist.values()),
+            vertices=vertices, step=sample_stride)
+    # The start frame and sample rate of the .pc2 files are taken from the
+    # first two samples, the index of the cache isn't needed for this (with
+    # block reads it's built while the frames are read).
+    first_frames = list(itertools.islice(frames, 2))
+    if not first_frames:
+        return
+    times = [ticks for (ticks, _) in first_frames]
+    if len(times) > 1:
+        samplerate = mayacache._ticks_to_frames(times[1] - times[0])
+    else:
+        samplerate = 1.0
+
+    pc2_filepaths = dict()
+    writers = dict()
+    try:
+        for ob in matchlist:
+            pc2_filepaths[ob] = os.path.join(pc2_directory,
+                    "{}.pc2".format(bpy.path.clean_name(ob.name)))
+            writers[ob] = Pc2Writer(pc2_filepaths[ob],
+                    len(ob.data.vertices),
+                    mayacache._ticks_to_frames(times[0]), samplerate)
+        last_positions = dict()
+        for (ticks, channeldict) in itertools.chain(first_frames, frames):
+            for ob in matchlist:
+                # A .pc2 file needs every sample, repeat the last one if
+                # the channel is missing at this time (or use the rest pose
+                # before its first sample).
+                pos = channeldict.get(matchlist[ob], last_positions.get(ob))
+                if pos is None:
+                    pos = np.empty(len(ob.data.vertices) * 3, np.float32)
+                    ob.data.vertices.foreach_get("co", pos)
+                    pos = pos.reshape(-1, 3)
+                writers[ob].write_sample(pos)
+                last_positions[ob] = pos
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    time_settings = dict(time_settings or {})
+    if time_settings.get("time_mode", 'FRAME') == 'FRAME':
+        # The modifier reads sample <frame_scale * frame - frame_start> of
+        # the .pc2 file, which has a sample every 'samplerate' frames from
+        # the first written time on.
+        frame_start = ((frame_start + mayacache._ticks_to_frames(times[0]))
+                / samplerate)
+        frame_scale = frame_scale / samplerate
+    for ob in matchlist:
+        add_mesh_cache_modifier(ob, pc2_filepaths[ob],
+                frame_start=frame_start,
+                use_relative_path=use_relative_path,
+                frame_scale=frame_scale, time_settings=time_settings)
+
+
+class TimeMap(object):
+    """
+    TimeMap(mayacache, fps, time_mode='FRAME', frame_start=0.0,
+            frame_scale=1.0)
+
+        Maps the time of a Maya Cache (in ticks) to scene frames and back,
+        the same way a Mesh Cache modifier maps the scene frame to the time
+        in the cache: <cache time> = 'frame_scale' * <scene frame> -
+        'frame_start', with the scene frame converted to seconds (with
+        'fps', the frame rate of the scene) for the 'TIME' and 'FACTOR'
+        time modes.
+        'FRAME' uses the frame numbers of the cache (ignoring its frame
+        rate), 'TIME' the time in seconds (so the cache is retimed to the
+        frame rate of the scene) and 'FACTOR' the position in the time range
+        of the cache (0 - 1).
+    """
+
+    def __init__(self, mayacache, fps, time_mode='FRAME', frame_start=0.0,
+            frame_scale=1.0):
+        if frame_scale <= 0.0:
+            raise ValueError("The frame scale should be greater than 0.")
+        self.__mayacache = mayacache
+        self.__fps = fps
+        self.__time_mode = time_mode
+        self.__frame_start = frame_start
+        self.__frame_scale = frame_scale
+
+    def to_frame(self, ticks):
+        """
+        to_frame(ticks)
+
+            Returns the scene frame (a float) of the cache time 'ticks'.
+        """
+
+        mc = self.__mayacache
+        if self.__time_mode == 'TIME':
+            cachetime = mc._ticks_to_seconds(ticks)
+        elif self.__time_mode == 'FACTOR':
+            cachetime = ((ticks - mc.starttime) /
+                    max(1, mc.endtime - mc.starttime))
+        else:
+            cachetime = mc._ticks_to_frames(ticks)
+        frame = (cachetime + self.__frame_start) / self.__frame_scale
+        if self.__time_mode != 'FRAME':
+            frame *= self.__fps
+
+        return frame
+
+    def to_ticks(self, frame):
+        """
+        to_ticks(frame)
+
+            Returns the cache time (in ticks) at the scene frame 'frame'.
+        """
+
+        mc = self.__mayacache
+        cachetime = self.__frame_scale * frame
+        if self.__time_mode != 'FRAME':
+            cachetime /= self.__fps
+        cachetime -= self.__frame_start
+        if self.__time_mode == 'TIME':
+            return mc._seconds_to_ticks(cachetime)
+        elif self.__time_mode == 'FACTOR':
+            return mc.starttime + cachetime * (mc.endtime - mc.starttime)
+
+        return mc._frames_to_ticks(cachetime)
+
+
+def resample_frames(frames, timemap, interpolation='LINEAR', frame_step=1):
+    """
+    resample_frames(frames, timemap, interpolation='LINEAR', frame_step=1)
+
+        Maps the samples of a cache ((<ticks>, <channeldict>), like
+        'iter_frames' yields them) to scene frames with 'timemap' and yields
+        them at every 'frame_step'th whole scene frame (starting at the
+        first sample) as (<frame>, <channeldict>).
+        A sample that falls on such a frame is passed on as it is, other
+        samples are only used for the frames around them: 'LINEAR'
+        interpolates the positions of the samples before and after a frame,
+        'NONE' holds the sample before it. So a cache with subframe samples
+        (or a retimed cache) gives one frame per 'frame_step' scene frames.
+    """
+
+    previous = None
+    next_frame = None
+    for (ticks, channeldict) in frames:
+        # Round off the float error of the time mapping.
+        frame = round(timemap.to_frame(ticks), 6)
+        if next_frame is None:
+            next_frame = math.ceil(frame)
+        while previous is not None and next_frame < frame:
+            (previous_frame, previous_channeldict) = previous
+            if interpolation == 'LINEAR':
+                weight = (next_frame - previous_frame) / (frame -
+                        previous_frame)
+                yield (next_frame, {ch: interpolate_vertices(pos,
+                                channeldict[ch], weight)
+                        for (ch, pos) in previous_channeldict.items()
+                        if ch in channeldict})
+            else:
+                yield (next_frame, previous_channeldict)
+            next_frame += frame_step
+        if next_frame == frame:
+            yield (next_frame, channeldict)
+            next_frame += frame_step
+        previous = (frame, channeldict)
+
+
+def interpolate_vertices(positions1, positions2, weight):
+    """
+    interpolate_vertices(positions1, positions2, weight)
+
+        Returns the positions linearly interpolated between 'positions1'
+        (weight 0) and 'positions2' (weight 1) as native floats.
+    """
+
+    positions1 = native_vertices(positions1)
+    positions2 = native_vertices(positions2)
+
+    return positions1 + (positions2 - positions1) * np.float32(weight)
+
+
+def run_keyframes(runs, sample_frames):
+    """
+    run_keyframes(runs, sample_frames)
+
+        Returns the keyframes for the key blocks of the runs of frames
+        ([<key block>, <first frame>, <last frame>]) as a list of
+        (<key block>, [(frame, value), ...]). A key block is fully on for
+        its run and is blended with its neighbours in the frames between the
+        previous and next samples in 'sample_frames'. Runs without a key
+        block (the rest pose) get no keyframes.
+    """
+
+    sample_index = {fr: i for (i, fr) in enumerate(sample_frames)}
+    keys = []
+    for (key_block, first, last) in runs:
+        if key_block is None:
+            continue
+        i = sample_index[first]
+        j = sample_index[last]
+        previous_frame = sample_frames[i - 1] if i > 0 else first - 1
+        if j + 1 < len(sample_frames):
+            next_frame = sample_frames[j + 1]
         else:
-            mc_filepath = None
-        if not mc_filepath:
-            raise_cachefile_error(2, "",
-                    "No Maya Cache .mc file could be found")
-        # Check if the file exists.
-        if not os.path.isfile(mc_filepath):
-            raise_cachefile_error(2, mc_filepath)
-        # Open the file and read till the end of the header.
-        with open(mc_filepath, "rb") as f:
-#        f = open(mc_filepath, "rb")
-            blocktag = f.read(4).decode()
-            if blocktag and blocktag != "FOR4":
-                raise_runtime_error("'FOR4' (at start of file)")
-            headersize = unpack(">l", f.read(4))[0]
-            f.seek(headersize, 1)
-
-            self.__mcfile_after_header = f.tell()
-
-        return mc_filepath
-
-    def read_channel_at_time(self, **kwargs):
+            next_frame = last + 1
+        points = [(previous_frame, 0.0), (first, 1.0)]
+        if last != first:
+            points.append((last, 1.0))
+        points.append((next_frame, 0.0))
+        keys.append((key_block, points))
+
+    return keys
+
+
+class FrameCache(object):
+    """
+    FrameCache(mayacache, channels, vertices=None, size=LIVE_CACHE_SIZE,
+               prefetch=LIVE_PREFETCH)
+
+        Keeps the last 'size' decoded frames of the channels of a (memory
+        mapped) Maya Cache (least recently used frames are dropped). A
+        background thread reads the next 'prefetch' frames (in the direction
+        of playback) ahead. Only the frames after the last requested one are
+        read ahead, older requests that weren't read yet are dropped (so
+        scrubbing doesn't queue up frames that are no longer needed).
+    """
+
+    def __init__(self, mayacache, channels, vertices=None,
+            size=LIVE_CACHE_SIZE, prefetch=LIVE_PREFETCH):
+        self.__mayacache = mayacache
+        self.__channels = channels
+        self.__vertices = vertices
+        self.__size = size
+        self.__prefetch = prefetch
+        self.__times = sorted(mayacache.index)
+        self.__frames = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__requests = queue.Queue(maxsize=prefetch)
+        self.__last_index = None
+        self.__thread = threading.Thread(target=self._prefetch_frames)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    @property
+    def times(self):
+        return self.__times
+
+    def _decode(self, ticks):
+        channeldict = self.__mayacache.read_frame(cachetime=ticks,
+                channels=self.__channels, vertices=self.__vertices) or {}
+
+        return {ch: native_vertices(pos) for (ch, pos) in channeldict.items()}
+
+    def _store(self, ticks, channeldict):
+        with self.__lock:
+            self.__frames[ticks] = channeldict
+            self.__frames.move_to_end(ticks)
+            while len(self.__frames) > self.__size:
+                self.__frames.popitem(last=False)
+
+    def _prefetch_frames(self):
+        while True:
+            ticks = self.__requests.get()
+            if ticks is None:
+                return
+            with self.__lock:
+                if ticks in self.__frames:
+                    continue
+            self._store(ticks, self._decode(ticks))
+
+    def _clear_requests(self):
+        try:
+            while True:
+                self.__requests.get_nowait()
+        except queue.Empty:
+            pass
+
+    def get(self, ticks):
         """
-        read_channel_at_time(**kwargs)
-
-            channel=None,
-            cachetime=None,
-
-            Reads the channel at the specified time. Returns the list
-            of vertex positions (as tuples per vertex) at that time.
-            Returns None if no info is found (non existing channel, wrong time
-            or end of file).
-
-            Warning: Nice to use to get the information for 1 channel at the
-            specified time, but quite slow if you want to process all the
-            frames for 1 or more channels. Because it looks up the time and
-            the channel every time for every object at every frame.
-            Could make it so that if no cachetime is given, it will read every
-            frame. And if no channel(s) are given it will read every channel.
+        get(ticks)
+
+            Returns the decoded frame ({<channel>: <vertexarray>}) at the
+            last sample at or before 'ticks' (clamped to the cache range) and
+            requests the next frames from the prefetch thread.
         """
 
-        # Get the keyword args, default to None if it's not given.
-        channel = kwargs.get("channel", None)
-        cachetime = kwargs.get("cachetime", None)
-        cachetype = self.cachetype
-        mc_filepath = self.__mc_filepath
-        with open(mc_filepath, "rb") as f:
-            f.seek(self.__mcfile_after_header)
-            # Raise appropriate error if one of the keyword args is not given.
-            if not channel:
-                raise TypeError("read_channel() missing required keyword"\
-                        " argument: 'channel'")
-            if not cachetime:
-                raise TypeError("read_channel() missing required keyword"\
-                        " argument: 'cachetime'")
-
-            # Now continue with reading the file.
-            if cachetype == "OneFile":  # For cachetype 'OneFile'.
-                ticks = self.starttime
-                while ticks <= self.endtime:  # Don't loop further then endtime.
-                    blocktag = f.read(4).decode()
-                    if blocktag and blocktag != "FOR4":
-                        raise_runtime_error(
-                                "'FOR4' (at beginning of time block)")
-                    elif not blocktag:  # We hit the end of the file.
-                        return None
-                    blocksize = unpack(">l", f.read(4))[0]
-                    bytes_read = 0
-                    blocktag = f.read(4).decode()
-                    bytes_read += 4
-                    if blocktag != "MYCH":
-                        raise_runtime_error("'MYCH'")
-                    blocktag = f.read(4).decode()
-                    bytes_read += 4
-                    if blocktag != "TIME":
-                        raise_runtime_error("'TIME'")
-                    f.seek(4, 1)  # Skip, not needed.
-                    bytes_read += 4
-                    ticks = unpack(">l", f.read(4))[0]
-                    bytes_read += 4
-                    if ticks == cachetime:  # Time found.
-                        while bytes_read < blocksize:
-                            blocktag = f.read(4).decode()
-                            bytes_read += 4
-                            if blocktag != "CHNM":
-                                raise_runtime_error("'CHNM'")
-                            channelname_size = unpack(">l", f.read(4))[0]
-                            bytes_read += 4
-                            # The channelname is padded out to 32 bit
-                            # boundaries. So we may need ot read more
-                            # then channelname_size.
-                            if channelname_size % 4 != 0:
-                                bytes_to_read = channelname_size + (4 -
-                                        (channelname_size % 4))
-                            else:
-                                bytes_to_read = channelname_size
-                            channelname = f.read(
-                                    channelname_size - 1).decode()
-                            f.seek(bytes_to_read -
-                                    (channelname_size - 1), 1)
-                            bytes_read += bytes_to_read
-                            if channelname != channel:
-                                # Skip to the size of the datablock. So we can
-                                # skip to the next channel.
-                                f.seek(16, 1)
-                                datasize = unpack(">l", f.read(4))[0]
-                                f.seek(datasize, 1)
-                                bytes_read += (16 + 4 + datasize)
-                                continue
-                            blocktag = f.read(4).decode()
-                            bytes_read += 4
-                            if blocktag != "SIZE":
-                                raise_runtime_error("'SIZE'")
-                            f.seek(4, 1)  # Skip, not needed.
-                            bytes_read += 4
-                            num_vertices = unpack(">l", f.read(4))[0]
-                            bytes_read += 4
-                            dataformat = f.read(4).decode()
-                            bytes_read += 4
-                            datasize = unpack(">l", f.read(4))[0]
-                            bytes_read += 4
-                            if dataformat == "FVCA":
-                                # Do an extra check.
-                                # num_vertices * 3 (x, y, z) * 4 (size of
-                                # float) should be the same as datasize.
-                                if not num_vertices * 3 * 4 == datasize:
-                                    raise ValueError(
-                                            "The datasize is not correct")
-                                vertexarray = array('f')
-                            elif dataformat == "DVCA":
-                                # Do an extra check.
-                                # num_vertices * 3 (x, y, z) * 8 (size of
-                                # double) should be the same as datasize.
-                                if not num_vertices * 3 * 8 == datasize:
-                                    raise ValueError(
-                                            "The datasize is not correct")
-                                vertexarray = array('d')
-                            else:
-                                raise ValueError(
-                                        "Wrong data format: {}".format(
-                                                dataformat))
-                            vertexarray.fromfile(f, num_vertices * 3)
-                            if sys.byteorder == "little":
-                                vertexarray.byteswap()
-                            vertex_position_list = [i for i in grouper(
-                                    3, vertexarray)]
-                            return vertex_position_list
-                    else:   # Go to the next time block.
-                        # We already read 16 bytes, so we should skip to
-                        # blocksize - 16 bytes.
-                        f.seek((blocksize - 16), 1)
-            else:       # The cachetype is 'OneFilePerFrame'
-                pass    # Not implemented yet.
-
-    def read_channels(self, **kwargs):
+        i = max(0, bisect.bisect_right(self.__times, ticks) - 1)
+        ticks = self.__times[i]
+        with self.__lock:
+            channeldict = self.__frames.get(ticks)
+            if channeldict is not None:
+                self.__frames.move_to_end(ticks)
+        if channeldict is None:
+            channeldict = self._decode(ticks)
+            self._store(ticks, channeldict)
+        # Read ahead in the direction we're playing.
+        step = -1 if self.__last_index is not None and \
+                i < self.__last_index else 1
+        self.__last_index = i
+        self._clear_requests()
+        for n in range(1, self.__prefetch + 1):
+            j = i + n * step
+            if not 0 <= j < len(self.__times):
+                break
+            self.__requests.put(self.__times[j])
+
+        return channeldict
+
+    def close(self):
         """
-        read_channels(**kwargs)
-
-            channels=self.channels,
-            starttime=self.starttime,
-            endtime=self.endtime,
-
-            Reads the channel(s) in the specified timerange.
-            If no channels are given, it will read all channels. If no
-            timerange is given it will use the timerange from the cache file.
-            Returns a dictionary or None:
-            {<time1>: {<channel1>: <vertexarray1>,
-                       <channel2>: <vertexarray2>, ... etc.},
-             <time2>: {channel1>: <vertexarray1>, ... etc.}
-            }
+        close()
+
+            Stops the prefetch thread and frees the frames.
         """
 
-        channels = kwargs.get("channel", self.channels)
-        starttime = kwargs.get("starttime", self.starttime)
-        endtime = kwargs.get("endtime", self.endtime)
-        cachetype = self.cachetype
-        mc_filepath = self.__mc_filepath
-
-        timedict = dict()
-
-        # Only cachetype 'OneFile' supported for now.
-        if not cachetype == "OneFile":
-            raise TypeError("Only cachetype 'OneFile' supported for now...")
-
-        with open(mc_filepath, "rb") as f:
-            f.seek(self.__mcfile_after_header)
-
-            # Now continue with reading the file.
-            ticks = starttime
-            while ticks <= endtime:  # Don't loop further then endtime.
-                blocktag = f.read(4).decode()
-                if blocktag and blocktag != "FOR4":
-                    raise_runtime_error(
-                            "'FOR4' (at beginning of time block)")
-                elif not blocktag:  # We hit the end of the file.
-                    return timedict
-                blocksize = unpack(">l", f.read(4))[0]
-                bytes_read = 0
-                blocktag = f.read(4).decode()
-                bytes_read += 4
-                if blocktag != "MYCH":
-                    raise_runtime_error("'MYCH'")
-                blocktag = f.read(4).decode()
-                bytes_read += 4
-                if blocktag != "TIME":
-                    raise_runtime_error("'TIME'")
-                f.seek(4, 1)  # Skip, not needed.
-                bytes_read += 4
-                ticks = unpack(">l", f.read(4))[0]
-                bytes_read += 4
-                if starttime <= ticks <= endtime:  # Time in range.
-                    channeldict = dict()
-                    while bytes_read < blocksize:
-                        blocktag = f.read(4).decode()
-                        bytes_read += 4
-                        if blocktag != "CHNM":
-                            raise_runtime_error("'CHNM'")
-                        channelname_size = unpack(">l", f.read(4))[0]
-                        bytes_read += 4
-                        # The channelname is padded out to 32 bit
-                        # boundaries. So we may need to read more
-                        # then channelname_size.
-                        if channelname_size % 4 != 0:
-                            bytes_to_read = channelname_size + (4 -
-                                    (channelname_size % 4))
-                        else:
-                            bytes_to_read = channelname_size
-                        channelname = f.read(channelname_size - 1).decode()
-                        f.seek(bytes_to_read - (channelname_size - 1), 1)
-                        bytes_read += bytes_to_read
-                        if not channelname in channels:
-                            # Skip the size of the datablock. So we reach the
-                            # next channel.
-                            f.seek(16, 1)
-                            datasize = unpack(">l", f.read(4))[0]
-                            f.seek(datasize, 1)
-                            bytes_read += (16 + 4 + datasize)
-                            continue
-                        blocktag = f.read(4).decode()
-                        bytes_read += 4
-                        if blocktag != "SIZE":
-                            raise_runtime_error("'SIZE'")
-                        f.seek(4, 1)  # Skip, not needed.
-                        bytes_read += 4
-                        num_vertices = unpack(">l", f.read(4))[0]
-                        bytes_read += 4
-                        dataformat = f.read(4).decode()
-                        bytes_read += 4
-                        datasize = unpack(">l", f.read(4))[0]
-                        bytes_read += 4
-                        if dataformat == "FVCA":
-                            # Do an extra check.
-                            # num_vertices * 3 (x, y, z) * 4 (size of
-                            # float) should be the same as datasize.
-                            if num_vertices * 3 * 4 != datasize:
-                                raise ValueError(
-                                        "The datasize is not correct")
-                            vertexarray = array('f')
-                        elif dataformat == "DVCA":
-                            # Do an extra check.
-                            # num_vertices * 3 (x, y, z) * 8 (size of
-                            # double) should be the same as datasize.
-                            if num_vertices * 3 * 8 != datasize:
-                                raise ValueError(
-                                        "The datasize is not correct")
-                            vertexarray = array('d')
-                        else:
-                            raise ValueError(
-                                    "Wrong data format: {}".format(
-                                            dataformat))
-                        vertexarray.fromfile(f, num_vertices * 3)
-                        bytes_read += datasize
-                        if sys.byteorder == "little":
-                            vertexarray.byteswap()
-                        vertex_position_list = (i for i in grouper(
-                                3, vertexarray))
-                        channeldict[channelname] = vertex_position_list
-                    else:   # Go to the next time block.
-                        timedict[ticks] = channeldict
-
-            return timedict
-
-
-def grouper(n, iterable, fillvalue=None):
-    args = [iter(iterable)] * n
-    return itertools.zip_longest(*args, fillvalue=fillvalue)
-
-
-def raise_cachefile_error(errno, filepath,
-        strerror="Maya Cache file not found"):
-    raise OSError(errno, strerror, filepath)
-
-
-def raise_runtime_error(tag):
-    raise RuntimeError("The cachefile seems corrupt."\
-            " {} tag not found".format(tag))
-
-
-def match_channels(channels, objects):
-    """
-    match_channels(channels, objects)
+        self._clear_requests()
+        self.__requests.put(None)
+        self.__thread.join()
+        with self.__lock:
+            self.__frames.clear()
 
-        Try to find the matching objects for the channelnames.
-        Returns the matches as a dictionary. Channels that could not be
-        matched have a value of None.
+
+class LiveCache(object):
+    """
+    LiveCache(xml_filepath, matchlist, vertices=None, time_settings=None,
+              use_block_reads=False)
+
+        Plays a Maya Cache without baking anything: it is added to the
+        'frame_change_pre' handlers and on every frame change it reads the
+        frame (through a FrameCache) and writes the positions into the
+        vertices of the matched objects. The scene frame is mapped to the
+        time of the cache with a TimeMap made with 'time_settings' (a
+        dictionary with the keyword arguments of 'TimeMap'). The original
+        positions are restored when it is stopped (see 'stop_live_caches')
+        and while the .blend file is saved (see 'restore_live_caches'), so
+        the cache is never saved in the meshes.
     """
 
-    objects_channels_match = dict()
-    for ob in objects:
-        for ch in channels:
-            if ob.name in ch:
-                objects_channels_match[ob] = ch
+    is_live_cache = True
 
-    return objects_channels_match
+    def __init__(self, xml_filepath, matchlist, vertices=None,
+            time_settings=None, use_block_reads=False):
+        self.__mayacache = open_cache(xml_filepath, use_block_reads)
+        self.__timemap = TimeMap(self.__mayacache,
+                **(time_settings or {"fps": self.__mayacache.fps}))
+        # Store the names, the objects can be gone after an undo.
+        self.__channels = {ob.name: ch for (ob, ch) in matchlist.items()}
+        self.__rest_positions = dict()
+        for ob in matchlist:
+            rest_positions = np.empty(len(ob.data.vertices) * 3,
+                    dtype=np.float32)
+            ob.data.vertices.foreach_get("co", rest_positions)
+            self.__rest_positions[ob.name] = rest_positions
+        self.__framecache = FrameCache(self.__mayacache,
+                set(matchlist.values()), vertices)
 
+    @property
+    def object_names(self):
+        return set(self.__channels)
+
+    def __call__(self, scene):
+        ticks = self.__timemap.to_ticks(scene.frame_current)
+        channeldict = self.__framecache.get(ticks)
+        for (name, ch) in self.__channels.items():
+            ob = bpy.data.objects.get(name)
+            if ob is None or ch not in channeldict:
+                continue
+            ob.data.vertices.foreach_set("co", channeldict[ch].ravel())
+            ob.data.update()
 
-def load(operator, context, filepath, *args, **kwargs):
+    def restore(self):
+        """
+        restore()
+
+            Restores the original positions, the cache keeps playing on the
+            next frame change.
+        """
+
+        for (name, rest_positions) in self.__rest_positions.items():
+            ob = bpy.data.objects.get(name)
+            if ob is not None and len(ob.data.vertices) * 3 == len(
+                    rest_positions):
+                ob.data.vertices.foreach_set("co", rest_positions)
+                ob.data.update()
+
+    def stop(self):
+        """
+        stop()
+
+            Restores the original positions and closes the cache.
+        """
+
+        self.restore()
+        self.__framecache.close()
+        self.__mayacache.close()
+
+
+def live_caches():
     """
-    load(operator, context, filepath, *args, **kwargs)
+    live_caches()
 
-        Called by the user interface or another script.
-        This function checks and passes the file and sends the data off.
+        Returns the live caches in the frame change handlers.
     """
 
-    from time import time
+    return [handler for handler in bpy.app.handlers.frame_change_pre
+            if getattr(handler, "is_live_cache", False)]
 
-    now = time()
+
+def stop_live_caches(object_names=None):
+    """
+    stop_live_caches(object_names=None)
+
+        Removes the live caches from the frame change handlers and restores
+        the objects. If 'object_names' is given, only the live caches that
+        play one of these objects are stopped.
+    """
+
+    for live_cache in live_caches():
+        if (object_names is None or
+                live_cache.object_names & set(object_names)):
+            bpy.app.handlers.frame_change_pre.remove(live_cache)
+            live_cache.stop()
+
+
+def restore_live_caches():
+    """
+    restore_live_caches()
+
+        Restores the original positions of the objects of all live caches
+        (before the .blend file is saved), see 'update_live_caches'.
+    """
+
+    for live_cache in live_caches():
+        live_cache.restore()
+
+
+def update_live_caches(scene):
+    """
+    update_live_caches(scene)
+
+        Writes the current frame of all live caches into the objects again
+        (after the .blend file is saved).
+    """
+
+    for live_cache in live_caches():
+        live_cache(scene)
+
+
+def import_live_cache(mayacache, matchlist, vertices=None,
+        time_settings=None, use_block_reads=False):
+    """
+    import_live_cache(mayacache, matchlist, vertices=None,
+                      time_settings=None, use_block_reads=False)
+
+        Starts a LiveCache for the matched objects, nothing is baked. A live
+        cache that was already playing one of these objects is stopped.
+    """
+
+    stop_live_caches([ob.name for ob in matchlist])
+    live_cache = LiveCache(mayacache.filepath, matchlist, vertices,
+            time_settings, use_block_reads)
+    bpy.app.handlers.frame_change_pre.append(live_cache)
+    live_cache(bpy.context.scene)
+
+
+def import_shape_keys(mayacache, matchlist, animation_method='FCURVE',
+        vertices=None, static_tolerance=None, sample_stride=1, timemap=None,
+        interpolation='LINEAR'):
+    """
+    import_shape_keys(mayacache, matchlist, animation_method='FCURVE',
+                      vertices=None, static_tolerance=None, sample_stride=1,
+                      timemap=None, interpolation='LINEAR')
+
+        Imports the matched channels of the Maya Cache as one shape key per
+        frame, animated by 'animation_method' (see 'load'). 'EVAL_TIME'
+        makes the shape keys absolute, so objects that already have relative
+        shape keys are animated with 'FCURVE' instead.
+        'vertices' are the vertex subsets per channel (see
+        'iter_frames').
+        If 'static_tolerance' is not None, frames in which no vertex moved
+        more than this distance are collapsed: a run of identical frames
+        gets a single shape key and frames that match the rest pose get no
+        shape key at all (so channels that never deform add nothing).
+        Only every 'sample_stride'th sample is read. The samples are placed
+        at the scene frames of 'timemap' (a TimeMap, by default the frame
+        numbers of the cache) and resampled to every 'sample_stride'th whole
+        frame with 'interpolation' (see 'resample_frames'), so a stride
+        also leaves out the frames between the samples that are read.
+    """
+
+    def add_frame_key(ob, fr, pos):
+            # Insert new shape key.
+            key_block = ob.shape_key_add(name='frame_%.4d' % fr,
+                    from_mix=False)
+            # Write all coordinates at once from a flat buffer of native
+            # floats, instead of one vertex at a time.
+            key_block.data.foreach_set("co", native_vertices(pos).ravel())
+
+            return key_block
+
+    relative_objects = set()
+    if animation_method == 'EVAL_TIME':
+        relative_objects = {ob for ob in matchlist
+                if has_relative_shape_keys(ob)}
+
+    # The positions the next frame is compared with, starting with the rest
+    # pose.
+    rests = dict()
+    references = dict()
+    for ob in matchlist:
+        if not hasattr(ob.data.shape_keys, "key_blocks"):
+            ob.shape_key_add('Basis')
+            ob.data.update()
+        if static_tolerance is not None:
+            rest_positions = np.empty(len(ob.data.vertices) * 3,
+                    dtype=np.float32)
+            ob.data.vertices.foreach_get("co", rest_positions)
+            rests[ob] = rest_positions.reshape(-1, 3)
+            references[ob] = rests[ob]
+
+    # Process the cache frame by frame, so only the data of the current
+    # frame is kept in memory. Every object gets a list of runs of frames
+    # with the same positions: [<key block>, <first frame>, <last frame>].
+    # A run without key block is the rest pose.
+    runs = {ob: [] for ob in matchlist}
+    sample_frames = []
+    frames = mayacache.iter_frames(channels=set(matchlist.values()),
+            vertices=vertices, step=sample_stride)
+    if timemap is None:
+        timemap = TimeMap(mayacache, mayacache.fps)
+    for (frame, channeldict) in resample_frames(frames, timemap,
+            interpolation, sample_stride):
+        sample_frames.append(frame)
+        for ob in matchlist:
+            pos = channeldict.get(matchlist[ob])
+            if pos is None:
+                continue
+            reference = references.get(ob)
+            if reference is not None and np.allclose(pos, reference,
+                    rtol=0.0, atol=static_tolerance):
+                if runs[ob]:
+                    runs[ob][-1][2] = frame
+                else:
+                    runs[ob].append([None, frame, frame])
+                continue
+            if reference is not None and np.allclose(pos, rests[ob],
+                    rtol=0.0, atol=static_tolerance):
+                # Back in the rest pose.
+                runs[ob].append([None, frame, frame])
+                references[ob] = rests[ob]
+                continue
+            key_block = add_frame_key(ob, frame, pos)
+            runs[ob].append([key_block, frame, frame])
+            if static_tolerance is not None:
+                references[ob] = native_vertices(pos)
+
+    for ob in matchlist:
+        keys = run_keyframes(runs[ob], sample_frames)
+        print("{}: {} shape keys for {} frames".format(ob.name, len(keys),
+                len(sample_frames)))
+        if animation_method == 'EVAL_TIME' and ob not in relative_objects:
+            # One F-Curve for all frames, instead of one per key block.
+            add_eval_time_fcurve(ob.data.shape_keys, runs[ob])
+        elif animation_method in ('FCURVE', 'EVAL_TIME'):
+            # Animate all the new key blocks at once.
+            add_shape_key_fcurves(ob.data.shape_keys, keys)
+        else:
+            for (key_block, points) in keys:
+                for (fr, value) in points:
+                    key_block.value = value
+                    key_block.keyframe_insert('value', frame=fr)
+        ob.data.update()
+
+
+def get_xml_filepath(filepath):
+    """
+    get_xml_filepath(filepath)
+
+        Returns the .xml file of the Maya Cache for 'filepath' (the .xml,
+        the .mc or the .mcx file).
+    """
 
     (base, ext) = os.path.splitext(filepath)
     if ext.lower() == ".xml":
         xml_filepath = filepath
-    elif ext.lower() == ".mc":
+    elif ext.lower() in (".mc", ".mcx"):
         xml_filepath = "".join((base, ".xml"))
     else:
         raise_cachefile_error(5,
                 "The file is not a valid Maya Cache file", filepath)
     if not os.path.isfile(xml_filepath):
             raise_cachefile_error(2, xml_filepath)
-    mayacache = MayaCache(xml_filepath)
-    scene_objects = [ob for ob in bpy.data.objects if ob.type == 'MESH']
-    matchlist = match_channels(mayacache.channels, scene_objects)
 
-    def updateMesh(ob, fr, **kwargs):
-            vertex_positions = kwargs.get("vertex_positions")
-            channel = kwargs.get("channel")
-            # Insert new shape key.
-            ob.shape_key_add('frame_%.4d' % fr)
+    return xml_filepath
 
-            index = len(ob.data.shape_keys.key_blocks) - 1
-            ob.active_shape_key_index = index
 
-            shapeKeys = ob.data.shape_keys
-            verts = shapeKeys.key_blocks[index].data
+def open_cache(xml_filepath, use_block_reads=False):
+    """
+    open_cache(xml_filepath, use_block_reads=False)
 
-            pos = vertex_positions[mayacache._frames_to_ticks(fr)][channel]
+        Opens a Maya Cache for importing. The cache is memory mapped, unless
+        'use_block_reads' is True: then every time block is read in one go
+        (for caches on network storage, see 'MayaCache').
+    """
 
-            for v in verts:
-                x, y, z = pos.__next__()
-                v.co[:] = x, y, z
+    return MayaCache(xml_filepath, use_mmap=not use_block_reads,
+            use_block_reads=use_block_reads)
 
-            # Insert keyframes
-            shapeKeys.key_blocks[index].value = 0.0
-            shapeKeys.key_blocks[index].keyframe_insert('value', frame=fr - 1)
 
-            shapeKeys.key_blocks[index].value = 1.0
-            shapeKeys.key_blocks[index].keyframe_insert('value', frame=fr)
+def match_objects(operator, mayacache, objects, vertex_stride=1,
+        selection=None, use_fuzzy_match=True):
+    """
+    match_objects(operator, mayacache, objects, vertex_stride=1,
+                  selection=None, use_fuzzy_match=True)
+
+        Matches the channels of the Maya Cache with 'objects' (see
+        'match_channels') and reports the channels that could not be
+        matched and the ones that were matched fuzzily. If 'selection' is
+        given, only the matches of these objects are kept (the channels are
+        still matched with all 'objects', so a channel of an unselected
+        object can't end up on a selected one with a similar name). Objects
+        with a different number of vertices than their channel are skipped.
+        Returns the matches ({<object>: <channel>}) and the vertex subsets
+        per channel for proxy objects (see 'proxy_vertices').
+    """
 
-            shapeKeys.key_blocks[index].value = 0.0
-            shapeKeys.key_blocks[index].keyframe_insert('value', frame=fr + 1)
+    (matchlist, unmatched, ambiguous, fuzzy) = match_channels(
+            mayacache.channels, objects, use_fuzzy_match)
+    if unmatched:
+        operator.report({'INFO'}, "No object found for {} channel(s): {}".
+                format(len(unmatched), ", ".join(unmatched)))
+    if ambiguous:
+        operator.report({'WARNING'}, "Skipping {} channel(s) that match "\
+                "more than one object: {}".format(len(ambiguous),
+                        ", ".join(ambiguous)))
+    if fuzzy:
+        channels_objects = {ch: ob for (ob, ch) in matchlist.items()}
+        operator.report({'WARNING'}, "Matched {} channel(s) by a similar "\
+                "name: {}".format(len(fuzzy), ", ".join("{} > {}".format(ch,
+                        channels_objects[ch].name) for ch in fuzzy)))
+    if selection is not None:
+        selection = set(selection)
+        for ob in list(matchlist):
+            if ob not in selection:
+                del matchlist[ob]
+    # The vertex data is written in bulk, so the number of (read) vertices
+    # of the channel has to match the mesh.
+    vertices = dict()
+    for ob in list(matchlist):
+        num_vertices = mayacache.num_vertices(matchlist[ob])
+        subset = proxy_vertices(ob, vertex_stride)
+        if subset is not None and num_vertices is not None:
+            vertices[matchlist[ob]] = subset
+            num_vertices = len(vertex_indices(subset, num_vertices))
+        if num_vertices != len(ob.data.vertices):
+            operator.report({'WARNING'}, "Skipping '{}': the channel '{}' "\
+                    "has {} vertices, the mesh has {}.".format(ob.name,
+                            matchlist[ob], num_vertices,
+                            len(ob.data.vertices)))
+            del matchlist[ob]
+
+    return (matchlist, vertices)
+
+
+def report_relative_shape_keys(operator, matchlist, **kwargs):
+    """
+    report_relative_shape_keys(operator, matchlist, **kwargs)
 
-            ob.data.update()
+        Warns about the objects that keep their relative shape keys when
+        importing with the 'EVAL_TIME' animation (see 'import_shape_keys').
+    """
+
+    if kwargs.get("cache_method", 'shape') != 'shape' or \
+            kwargs.get("animation_method", 'FCURVE') != 'EVAL_TIME':
+        return
+    names = [ob.name for ob in matchlist if has_relative_shape_keys(ob)]
+    if names:
+        operator.report({'WARNING'}, "Animating {} object(s) with relative "\
+                "shape keys by F-Curves instead of the frame index: {}".
+                format(len(names), ", ".join(names)))
+
+
+def cache_objects(context, use_selection=False):
+    """
+    cache_objects(context, use_selection=False)
+
+        Returns the mesh objects to import the cache on: the selected ones
+        if 'use_selection' is True, otherwise None (all objects).
+    """
+
+    if not use_selection:
+        return None
+
+    return [ob for ob in context.selected_objects if ob.type == 'MESH']
+
+
+def time_settings(context, **kwargs):
+    """
+    time_settings(context, **kwargs)
+
+        Returns the keyword arguments for a TimeMap from the import settings
+        (see 'load') and the frame rate of the scene.
+    """
+
+    render = context.scene.render
+
+    return {"fps": render.fps / render.fps_base,
+            "time_mode": kwargs.get("time_mode", 'FRAME'),
+            "frame_start": kwargs.get("frame_start", 0.0),
+            "frame_scale": kwargs.get("frame_scale", 1.0)}
+
+
+def scene_frame_range(mayacache, timemap):
+    """
+    scene_frame_range(mayacache, timemap)
+
+        Returns the first and last scene frame of the Maya Cache.
+    """
+
+    return (int(math.floor(timemap.to_frame(mayacache.starttime))),
+            int(math.ceil(timemap.to_frame(mayacache.endtime))))
+
+
+def scan_cache(xml_filepath):
+    """
+    scan_cache(xml_filepath)
+
+        Parses the .mc file(s) of a Maya Cache and builds its index (see
+        'MayaCache.index'). This is run in a worker thread, so it doesn't
+        touch any Blender data. Only the headers are read, the vertex data
+        is read (one frame at a time) when the cache is imported.
+        Returns the .xml file and the index.
+    """
+
+    with MayaCache(xml_filepath) as mayacache:
+        return (xml_filepath, mayacache.index)
+
+
+def scan_caches(xml_filepaths):
+    """
+    scan_caches(xml_filepaths)
+
+        Builds the indices of the Maya Caches (see 'scan_cache') in a pool
+        of worker threads, the results are yielded as soon as a cache is
+        scanned (not in the order of 'xml_filepaths'). Scanning is mostly
+        waiting for the disk, so threads are enough and Blender isn't
+        forked.
+    """
+
+    if len(xml_filepaths) < 2:
+        for xml_filepath in xml_filepaths:
+            yield scan_cache(xml_filepath)
+        return
+
+    max_workers = min(len(xml_filepaths), READ_WORKERS)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(scan_cache, xml_filepath)
+                for xml_filepath in xml_filepaths]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def import_cache(mayacache, matchlist, vertices, **kwargs):
+    """
+    import_cache(mayacache, matchlist, vertices, **kwargs)
+
+        Imports the Maya Cache with the chosen 'cache_method' (see 'load').
+    """
+
+    cache_method = kwargs.get("cache_method", 'shape')
+    animation_method = kwargs.get("animation_method", 'FCURVE')
+    use_relative_path = kwargs.get("use_relative_path", True)
+    sample_stride = kwargs.get("sample_stride", 1)
+    use_block_reads = kwargs.get("use_block_reads", False)
+    interpolation = kwargs.get("interpolation", 'LINEAR')
+    timemap_settings = time_settings(bpy.context, **kwargs)
+    if kwargs.get("use_static_detection", True):
+        static_tolerance = kwargs.get("static_tolerance", STATIC_TOLERANCE)
+    else:
+        static_tolerance = None
 
     print("\nProcessing Maya Cache '{mc.name}'...\n"\
           "Framerange: {mc.startframe} - {mc.endframe}\n"\
-          "Number of channels/objects: {len}".format(mc=mayacache,
-                  len=len(mayacache.channels)))
+          "Number of channels/objects: {len}\n"\
+          "Importing {matched} channel(s)".format(mc=mayacache,
+                  len=len(mayacache.channels),
+                  matched=len(matchlist)))
+
+    if cache_method == 'mod':
+        modifier_settings = {setting: kwargs[setting]
+                for setting in MODIFIER_TIME_SETTINGS if setting in kwargs}
+        import_mesh_cache(mayacache, matchlist, use_relative_path, vertices,
+                sample_stride, timemap_settings["frame_start"],
+                timemap_settings["frame_scale"], modifier_settings)
+    elif cache_method == 'live':
+        import_live_cache(mayacache, matchlist, vertices, timemap_settings,
+                use_block_reads)
+    else:
+        import_shape_keys(mayacache, matchlist, animation_method, vertices,
+                static_tolerance, sample_stride,
+                TimeMap(mayacache, **timemap_settings), interpolation)
 
-    vertex_positions = mayacache.read_channels()
-    for frame in range(mayacache.startframe, mayacache.endframe + 1):
-        for ob in matchlist:
-            bpy.context.scene.frame_current = frame
-            if frame == mayacache.startframe:
-                if not hasattr(ob.data.shape_keys, "key_blocks"):
-                    ob.shape_key_add('Basis')
-                    ob.data.update()
-            bpy.context.scene.objects.active = ob
-            updateMesh(ob, frame, vertex_positions=vertex_positions,
-                    channel=matchlist[ob])
+
+def load_batch(operator, context, filepaths, *args, **kwargs):
+    """
+    load_batch(operator, context, filepaths, *args, **kwargs)
+
+        Imports several Maya Caches at once (the keyword arguments are the
+        same as for 'load'). The channels are matched with the objects
+        first (only the first time block of every cache is read for this),
+        then the .mc files are parsed in parallel by worker threads and
+        each cache is imported as soon as its index is built. The frames
+        are read while importing, one at a time.
+    """
+
+    from time import time
+
+    now = time()
+
+    vertex_stride = kwargs.get("vertex_stride", 1)
+    use_block_reads = kwargs.get("use_block_reads", False)
+    use_fuzzy_match = kwargs.get("use_fuzzy_match", True)
+    selection = cache_objects(context, kwargs.get("use_selection", False))
+
+    scene_objects = [ob for ob in bpy.data.objects if ob.type == 'MESH']
+    mayacaches = dict()
+    for filepath in filepaths:
+        xml_filepath = get_xml_filepath(filepath)
+        mayacache = open_cache(xml_filepath, use_block_reads)
+        (matchlist, vertices) = match_objects(operator, mayacache,
+                scene_objects, vertex_stride, selection, use_fuzzy_match)
+        report_relative_shape_keys(operator, matchlist, **kwargs)
+        if matchlist:
+            mayacaches[xml_filepath] = (mayacache, matchlist, vertices)
+
+    for (xml_filepath, index) in scan_caches(sorted(mayacaches)):
+        (mayacache, matchlist, vertices) = mayacaches[xml_filepath]
+        mayacache.index = index
+        import_cache(mayacache, matchlist, vertices, **kwargs)
+        mayacache.close()
+
+    posttime = time()
+
+    processing_time = posttime - now
+    print("\nProcessed {} caches in {:.2f} seconds".format(len(mayacaches),
+            processing_time))
+
+    if mayacaches:
+        frame_ranges = [scene_frame_range(mc, TimeMap(mc,
+                        **time_settings(context, **kwargs)))
+                for (mc, _, _) in mayacaches.values()]
+        bpy.context.scene.frame_start = min(r[0] for r in frame_ranges)
+        bpy.context.scene.frame_end = max(r[1] for r in frame_ranges)
+        bpy.context.scene.frame_current = bpy.context.scene.frame_start
+
+    return {'FINISHED'}
+
+
+def load(operator, context, filepath, *args, **kwargs):
+    """
+    load(operator, context, filepath, *args, **kwargs)
+
+        Called by the user interface or another script.
+        This function checks and passes the file and sends the data off.
+
+        use_selection=False,
+
+            Only import the cache on the selected objects. Only the
+            channels of these objects are read, the data of all other
+            channels is skipped.
+
+        use_fuzzy_match=True,
+
+            Match the channels that have no object with the same name with
+            the object with the most similar name (names with different
+            numbers are never similar). Every such match is reported.
+
+        cache_method='shape',
+
+            How to import the cache. 'shape' imports it as shape keys,
+            'mod' transcodes it to .pc2 files that are read by a Mesh Cache
+            modifier and 'live' reads the frames from the cache while
+            playing (see 'LiveCache').
+
+        animation_method='FCURVE',
+
+            How to animate the shape keys. 'FCURVE' builds the F-Curves of
+            all key blocks in one pass after the import, 'KEYFRAME' inserts
+            the keyframes one by one (slow). 'EVAL_TIME' makes the shape
+            keys absolute and selects the key of every frame with a single
+            'eval_time' F-Curve, so the number of F-Curves doesn't grow
+            with the number of frames (fastest playback). Objects that
+            already have relative shape keys keep them and get 'FCURVE'
+            instead (this is reported).
+
+        use_static_detection=True,
+        static_tolerance=STATIC_TOLERANCE,
+
+            Collapse runs of frames in which no vertex moved more than
+            'static_tolerance' into one shape key, and don't add shape keys
+            for frames that match the rest pose.
+
+        use_relative_path=True,
+
+            Use a relative path for the .pc2 files of the Mesh Cache
+            modifiers.
+
+        vertex_stride=1,
+
+            Only read every Nth vertex of the channels, to bind them to
+            (lower resolution) proxy objects. An object with a
+            'mc_vertex_indices' property gets the vertices with these
+            indices instead.
+
+        sample_stride=1,
+
+            Only import every Nth sample of the cache.
+
+        use_block_reads=False,
+
+            Read every time block of the cache in one go instead of memory
+            mapping it (faster for caches on network storage).
+
+        time_mode='FRAME',
+        frame_start=0.0,
+        frame_scale=1.0,
+
+            How the time of the cache is mapped to scene frames, the same
+            way as a Mesh Cache modifier does it (see 'TimeMap'). Samples
+            that don't fall on whole scene frames are resampled.
+
+        interpolation='LINEAR',
+
+            How frames between two samples are resampled: 'LINEAR'
+            interpolates the positions, 'NONE' holds the previous sample.
+
+        play_mode='SCENE',
+        eval_frame=0.0,
+        eval_time=0.0,
+        eval_factor=0.0,
+
+            Only used for the Mesh Cache modifier ('mod'), together with
+            'time_mode' and 'interpolation'. Shape keys and live caches
+            always follow the scene time.
+    """
+
+    from time import time
+
+    now = time()
+
+    vertex_stride = kwargs.get("vertex_stride", 1)
+    use_fuzzy_match = kwargs.get("use_fuzzy_match", True)
+    selection = cache_objects(context, kwargs.get("use_selection", False))
+
+    xml_filepath = get_xml_filepath(filepath)
+    mayacache = open_cache(xml_filepath,
+            kwargs.get("use_block_reads", False))
+    scene_objects = [ob for ob in bpy.data.objects if ob.type == 'MESH']
+    (matchlist, vertices) = match_objects(operator, mayacache, scene_objects,
+            vertex_stride, selection, use_fuzzy_match)
+    report_relative_shape_keys(operator, matchlist, **kwargs)
+
+    import_cache(mayacache, matchlist, vertices, **kwargs)
 
     posttime = time()
 
     processing_time = posttime - now
     print("\nProcessed in {:.2f} seconds".format(processing_time))
+    mayacache.close()
 
-    bpy.context.scene.frame_start = mayacache.startframe
-    bpy.context.scene.frame_end = mayacache.endframe
-    bpy.context.scene.frame_current = mayacache.startframe
+    (frame_start, frame_end) = scene_frame_range(mayacache,
+            TimeMap(mayacache, **time_settings(context, **kwargs)))
+    bpy.context.scene.frame_start = frame_start
+    bpy.context.scene.frame_end = frame_end
+    bpy.context.scene.frame_current = frame_start
 
     return {'FINISHED'}
@@ -0,0 +1,1662 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Reading (and writing) of Maya Cache files (.xml + .mc).
+
+This module doesn't use Blender, so it can also be used (and benchmarked)
+outside of it.
+"""
+
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import json
+import mmap
+import os
+import re
+from struct import pack, unpack, unpack_from
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+
+# Version of the layout of the sidecar index file.
+INDEX_VERSION = 2
+
+# Number of threads used to read the files of 'OneFilePerFrame' caches.
+READ_WORKERS = 8
+
+# Layout of the blocks of the data files. 'mcc' caches (.mc files) use FOR4
+# blocks with 32 bit sizes, aligned to 4 bytes. The 64 bit 'mcx' caches (.mcx
+# files, for caches over 2 GB) use FOR8 blocks with 64 bit sizes, aligned to
+# 8 bytes: every tag is padded to 8 bytes and so is the data of a chunk.
+BlockFormat = namedtuple("BlockFormat",
+        "grouptag extension tagsize sizeformat sizesize alignment")
+BLOCK_FORMATS = {
+    "mcc": BlockFormat("FOR4", ".mc", 4, ">L", 4, 4),
+    "mcx": BlockFormat("FOR8", ".mcx", 8, ">Q", 8, 8),
+    }
+
+# Location of a time block in the .mc file and of the channels in it.
+BlockInfo = namedtuple("BlockInfo", "filepath offset size channels")
+ChannelInfo = namedtuple("ChannelInfo", "offset num_vertices dataformat")
+
+# The parsed .xml files: {(<filepath>, <mtime>): <cache info>}.
+_xmlfile_cache = dict()
+
+# Gaps (in bytes) between the vertices of a subset smaller than this are
+# read over, instead of doing a separate read for every range.
+SUBSET_READ_GAP = 4096
+
+# Size in bytes of a single value for the vertex data formats.
+DATAFORMAT_SIZES = {"FVCA": 4, "DVCA": 8}
+
+
+class MayaCache(object):
+    """
+    MayaCache(filepath, use_index_file=False, use_mmap=False,
+              max_workers=READ_WORKERS, use_block_reads=False)
+
+        A class to store and read all information of a Maya Cache.
+        'filepath' should be the .xml file from the Maya Cache.
+        The parsed .xml file is cached (per path and modification time) and
+        the .mc file(s) are only opened when the data is accessed, so
+        creating a MayaCache to look at the header information is cheap.
+        On first data access the .mc file is scanned once and the offsets
+        of all time blocks and channels are stored in an index. If
+        'use_index_file' is True, the index is also stored in (and read
+        from) a '.mcindex' file next to the .xml file.
+        If 'use_mmap' is True, the .mc file is memory mapped and the
+        channels are returned as big endian NumPy arrays of shape
+        (num_vertices, 3) directly over the file (no copy is made). Use
+        'native_vertices' to convert them when native floats are needed.
+        A memory mapped cache should be closed with 'close' (or used as a
+        context manager).
+        For the cachetype 'OneFilePerFrame' the frame files are found in the
+        directory of the .xml file and read concurrently by 'max_workers'
+        threads.
+        If 'use_block_reads' is True, every time block is read in one go
+        into a buffer (both for scanning and for reading the data) and
+        'iter_frames' reads the next block on a background thread while the
+        current one is processed. This is meant for caches on network
+        storage, where the number of (small) reads limits the speed. The
+        channels of a block read are returned as big endian NumPy arrays
+        over the buffer, like with 'use_mmap'.
+    """
+
+    def __init__(self, filepath, use_index_file=False, use_mmap=False,
+            max_workers=READ_WORKERS, use_block_reads=False):
+        if not os.path.isfile(filepath):
+            raise_cachefile_error(2, filepath)
+        elif not os.path.splitext(filepath)[-1].lower() == ".xml":
+            raise_cachefile_error(5,
+                "The file is not a valid Maya Cache file", filepath)
+        self.__xmlfile = filepath
+        self.__name = os.path.splitext(os.path.split(filepath)[-1])[0]
+        self.__cacheinfo = self._parse_xmlfile(filepath)
+        # The .mc file(s) are only opened on first data access.
+        self.__mc_filepath = None
+        self.__frame_files = None
+        self.__max_workers = max_workers
+        self.__use_index_file = use_index_file
+        self.__index = None
+        self.__use_mmap = use_mmap
+        self.__use_block_reads = use_block_reads
+        self.__mmaps = dict()
+        self.__mmaps_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __str__(self):
+        prettyprint = "{line}\n"\
+                "** Maya Cache File: {self.name}.xml **\n"\
+                "{line}\n"\
+                "- Cache type: {self.cachetype}\n"\
+                "- Time per frame: {self.timeperframe}\n"\
+                "- Frames per second: {fps}\n"\
+                "- Start time: {starttime} seconds\n"\
+                "- Start frame: {startframe}\n"\
+                "- End time:  {endtime} seconds\n"\
+                "- End frame: {endframe}\n"\
+                "- Number of channels: {numchannels}".format(self=self,
+                        line="*" * (27 + len(self.name)),
+                        starttime=self._ticks_to_seconds(self.starttime),
+                        startframe=self.startframe,
+                        endtime=self._ticks_to_seconds(self.endtime),
+                        endframe=self.endframe,
+                        fps=self.fps,
+                        numchannels=self.numchannels)
+        if self.numchannels:
+            prettyprint += "\n- Channels:\n  - "
+            prettyprint += "\n  - ".join(self.channels)
+
+        return prettyprint
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def filepath(self):
+        return self.__xmlfile
+
+    @property
+    def cachetype(self):
+        return self.__cacheinfo['cachetype']
+
+    @property
+    def cacheformat(self):
+        return self.__cacheinfo['cacheformat']
+
+    @property
+    def _extension(self):
+        return BLOCK_FORMATS[self.cacheformat].extension
+
+    @property
+    def timeperframe(self):
+        return self.__cacheinfo['timeperframe']
+
+    @property
+    def fps(self):
+        return 6000 / self.timeperframe
+
+    @property
+    def starttime(self):
+        return self.__cacheinfo['cachestarttime']
+
+    @property
+    def startframe(self):
+        return int(self._ticks_to_frames(self.starttime))
+
+    @property
+    def endtime(self):
+        return self.__cacheinfo['cacheendtime']
+
+    @property
+    def endframe(self):
+        return int(self._ticks_to_frames(self.endtime))
+
+    @property
+    def numchannels(self):
+        return len(self.__cacheinfo['channels'])
+
+    @property
+    def channels(self):
+        return sorted([self.__cacheinfo['channels'][k]['channelname']
+                for k in self.__cacheinfo['channels']])
+
+    @classmethod
+    def _parse_xmlfile(cls, filepath):
+        """
+        _parse_xmlfile(filepath)
+
+            Returns the information of the xml file (see '_read_xmlfile').
+            The result is cached per path and modification time of the file,
+            so every .xml file is only parsed once.
+        """
+
+        key = (os.path.abspath(filepath), os.stat(filepath).st_mtime)
+        cache_info = _xmlfile_cache.get(key)
+        if cache_info is None:
+            cache_info = cls._read_xmlfile(filepath)
+            _xmlfile_cache[key] = cache_info
+
+        return cache_info
+
+    @staticmethod
+    def _read_xmlfile(filepath):
+        """
+        _read_xmlfile(filepath)
+
+            Parses the xml file accompanying the mc file for the Maya Cache.
+            Returns all needed information as a dict.
+        """
+
+        # Parse the file to a tree and get the relevant information.
+        tree = ET.parse(filepath)
+        cache = tree.getroot()
+        cachename = cache.tag
+        cachetype = cache.find("cacheType").attrib['Type']
+        cacheformat = cache.find("cacheType").attrib['Format']
+        timerange = cache.find("time").attrib['Range']
+        timerange_split = timerange.split("_")
+        if len(timerange_split) > 2:
+            raise Exception("The time range {} is not valid.".
+                    format(timerange))
+        cachestarttime = int(timerange.split("-")[0])
+        cacheendtime = int(timerange.split("-")[1])
+        timeperframe = int(cache.find("cacheTimePerFrame").
+                attrib['TimePerFrame'])
+        cacheversion = float(cache.find("cacheVersion").attrib['Version'])
+        channels = list(cache.find("Channels"))
+
+        # Do sanity checks for some values.
+        if cachename != "Autodesk_Cache_File":
+            raise Exception("Cache file is unsupported type {}, should be"\
+                    " 'Autodesk_Cache_File'.".format(cachename))
+        if cachetype not in ("OneFile", "OneFilePerFrame"):
+            raise Exception("Cache type is unsupported type '{}', should be "\
+                    "'OneFile' or 'OneFilePerFrame'.".format(cachetype))
+        if cacheformat not in BLOCK_FORMATS:
+            raise Exception("Cache format is unsupported format {}, should be"\
+                    " 'mcc' or 'mcx'.".format(cacheformat))
+        if str(cacheversion) != "2.0":
+            raise Exception("Cache version {} is not supported, only version"\
+                    " 2.0 is supported.".format(cacheversion))
+
+        # Get the information per channel.
+        channels_info = dict()
+        for channel in channels:
+            channel_info = {attr.lower(): channel.attrib[attr]
+                    for attr in channel.attrib if "channel" in channel.tag}
+            channels_info[channel.tag] = channel_info
+
+        # Store all the info in the cache_info dictionary.
+        cache_info = dict()
+        cache_info['cachetype'] = cachetype
+        cache_info['cacheformat'] = cacheformat
+        cache_info['cachestarttime'] = cachestarttime
+        cache_info['cacheendtime'] = cacheendtime
+        cache_info['timeperframe'] = timeperframe
+        cache_info['channels'] = channels_info
+
+        return cache_info
+
+    def _ticks_to_frames(self, ticks):
+        return ticks / self.timeperframe
+
+    def _frames_to_ticks(self, frames):
+        return frames * self.timeperframe
+
+    def _ticks_to_seconds(self, ticks):
+        return ticks / 6000
+
+    def _seconds_to_ticks(self, seconds):
+        return seconds * 6000
+
+    def _open_mcfile(self, framenumber=None):
+        """
+        _open_mcfile(framenumber=None)
+
+            First checks the type of the Maya Cache. According to this
+            it opens the correct .mc (or .mcx) file, checks the header and
+            then returns the filepath of the file.
+        """
+
+        # Check the cache type and get the right .mc file for this.
+        (base, _) = os.path.splitext(self.__xmlfile)
+        if self.cachetype == "OneFile":
+            mc_filepath = "".join((base, self._extension))
+        elif self.cachetype == "OneFilePerFrame":
+            if not framenumber:
+                raise TypeError("The frame number is not specified.")
+            elif not isinstance(framenumber, int):
+                # Convert to int or raise an error.
+                try:
+                    framenumber = int(framenumber)
+                except ValueError:
+                    raise TypeError("The frame number should be an integer.")
+            mc_filepath = "".join((base,
+                    "Frame{}".format(framenumber), self._extension))
+        else:
+            mc_filepath = None
+        if not mc_filepath:
+            raise_cachefile_error(2, "",
+                    "No Maya Cache .mc file could be found")
+        # Check if the file exists.
+        if not os.path.isfile(mc_filepath):
+            raise_cachefile_error(2, mc_filepath)
+        # Open the file and check the header.
+        with open(mc_filepath, "rb") as f:
+            blockformat = self._read_header(f)
+        if blockformat is not BLOCK_FORMATS[self.cacheformat]:
+            raise_runtime_error("'{}' (at start of file)".format(
+                    BLOCK_FORMATS[self.cacheformat].grouptag))
+
+        return mc_filepath
+
+    def _find_frame_files(self):
+        """
+        _find_frame_files()
+
+            For the cachetype 'OneFilePerFrame'. Finds the .mc files of all
+            frames in the directory of the .xml file (<name>Frame<N>.mc and
+            <name>Frame<N>Tick<M>.mc for subframes, .mcx for 'mcx' caches).
+            Returns a dictionary with the time (in ticks) as key and the
+            filepath as value.
+        """
+
+        directory = os.path.dirname(self.__xmlfile)
+        frame_pattern = re.compile(r"^{}Frame(-?\d+)(?:Tick(\d+))?{}$".
+                format(re.escape(self.name), re.escape(self._extension)))
+        frame_files = dict()
+        for filename in os.listdir(directory or os.curdir):
+            match = frame_pattern.match(filename)
+            if not match:
+                continue
+            ticks = (self._frames_to_ticks(int(match.group(1))) +
+                    int(match.group(2) or 0))
+            if self.starttime <= ticks <= self.endtime:
+                frame_files[ticks] = os.path.join(directory, filename)
+        if not frame_files:
+            raise_cachefile_error(2, os.path.join(directory,
+                    "{}Frame*{}".format(self.name, self._extension)))
+
+        return frame_files
+
+    @staticmethod
+    def _read_header(f):
+        """
+        _read_header(f)
+
+            Checks the header of the open .mc or .mcx file 'f' and skips it.
+            Returns the BlockFormat of the file (see 'BLOCK_FORMATS'), taken
+            from the tag of the header.
+        """
+
+        grouptag = f.read(4).decode()
+        if not grouptag:
+            return BLOCK_FORMATS["mcc"]
+        blockformat = get_blockformat(grouptag)
+        if blockformat is None:
+            raise_runtime_error("'FOR4' or 'FOR8' (at start of file)")
+        # Skip the padding of the tag.
+        f.seek(blockformat.tagsize - 4, 1)
+        headersize = read_size(f, blockformat)
+        f.seek(headersize, 1)
+
+        return blockformat
+
+    @classmethod
+    def _scan_mcfile(cls, mc_filepath, ticks=None, use_block_reads=False):
+        """
+        _scan_mcfile(mc_filepath, ticks=None, use_block_reads=False)
+
+            Walks over all the time blocks of the .mc or .mcx file once (see
+            '_iter_mcfile' and, for 'use_block_reads', '_scan_mcfile_blocks').
+            Returns a dictionary with the time (in ticks) as key and a
+            BlockInfo as value.
+        """
+
+        if use_block_reads:
+            return cls._scan_mcfile_blocks(mc_filepath, ticks)
+
+        return dict(cls._iter_mcfile(mc_filepath, ticks))
+
+    @classmethod
+    def _iter_mcfile(cls, mc_filepath, ticks=None):
+        """
+        _iter_mcfile(mc_filepath, ticks=None)
+
+            Walks over the time blocks of the .mc or .mcx file. Only the
+            header, block and channel headers are read, the vertex data
+            itself is skipped. The time blocks of a 'OneFilePerFrame' cache
+            have no 'TIME' tag, for these 'ticks' is used as time.
+            Yields a (<time>, BlockInfo) tuple per block, so a caller that
+            stops early doesn't read the rest of the file.
+        """
+
+        with open(mc_filepath, "rb") as f:
+            blockformat = cls._read_header(f)
+            (tagsize, alignment) = (blockformat.tagsize,
+                    blockformat.alignment)
+            while True:
+                blocktag = read_tag(f, blockformat)
+                if not blocktag:    # We hit the end of the file.
+                    break
+                elif blocktag != blockformat.grouptag:
+                    raise_runtime_error("'{}' (at beginning of time "\
+                            "block)".format(blockformat.grouptag))
+                blocksize = read_size(f, blockformat)
+                blockoffset = f.tell()
+                bytes_read = 0
+                blocktag = read_tag(f, blockformat)
+                bytes_read += tagsize
+                if blocktag != "MYCH":
+                    raise_runtime_error("'MYCH'")
+                (blocktag, size) = read_chunk_header(f, blockformat)
+                if blocktag == "TIME":
+                    blockticks = read_value(f, size, blockformat)
+                    bytes_read += chunk_size(size, blockformat)
+                elif ticks is not None:
+                    # No time in the block, the channels start right away.
+                    f.seek(-(tagsize + blockformat.sizesize), 1)
+                    blockticks = ticks
+                else:
+                    raise_runtime_error("'TIME'")
+                channels = dict()
+                while bytes_read < blocksize:
+                    (blocktag, channelname_size) = read_chunk_header(f,
+                            blockformat)
+                    if blocktag != "CHNM":
+                        raise_runtime_error("'CHNM'")
+                    # The channelname is null terminated and padded out to
+                    # the alignment of the file. So we may need to read
+                    # more then channelname_size.
+                    channelname = f.read(padded_size(channelname_size,
+                            alignment))[:channelname_size - 1].decode()
+                    bytes_read += chunk_size(channelname_size, blockformat)
+                    (blocktag, size) = read_chunk_header(f, blockformat)
+                    if blocktag != "SIZE":
+                        raise_runtime_error("'SIZE'")
+                    num_vertices = read_value(f, size, blockformat)
+                    bytes_read += chunk_size(size, blockformat)
+                    (dataformat, datasize) = read_chunk_header(f,
+                            blockformat)
+                    check_datasize(dataformat, num_vertices, datasize)
+                    channels[channelname] = ChannelInfo(f.tell(),
+                            num_vertices, dataformat)
+                    # Skip the data itself, it's read on demand.
+                    f.seek(padded_size(datasize, alignment), 1)
+                    bytes_read += chunk_size(datasize, blockformat)
+                yield (blockticks, BlockInfo(mc_filepath, blockoffset,
+                        blocksize, channels))
+
+    @classmethod
+    def _scan_mcfile_blocks(cls, mc_filepath, ticks=None):
+        """
+        _scan_mcfile_blocks(mc_filepath, ticks=None)
+
+            Like '_scan_mcfile', but every time block is read with a single
+            read (see '_iter_mcfile_blocks'). The vertex data is read as
+            well, so this only pays off where small reads are expensive
+            (network storage).
+        """
+
+        return {blockticks: block for (blockticks, block, _) in
+                cls._iter_mcfile_blocks(mc_filepath, ticks)}
+
+    @classmethod
+    def _iter_mcfile_blocks(cls, mc_filepath, ticks=None):
+        """
+        _iter_mcfile_blocks(mc_filepath, ticks=None)
+
+            Like '_iter_mcfile', but every time block is read with a single
+            read (together with the header of the next block) and its
+            headers are parsed from the buffer (see 'parse_time_block').
+            Yields a (<time>, BlockInfo, <buffer>) tuple per block, the
+            buffer holds the whole block (see 'read_blockbuffer').
+        """
+
+        with open(mc_filepath, "rb") as f:
+            blockformat = cls._read_header(f)
+            headersize = blockformat.tagsize + blockformat.sizesize
+            header = f.read(headersize)
+            while header:
+                if len(header) < headersize or \
+                        header[:4].decode() != blockformat.grouptag:
+                    raise_runtime_error("'{}' (at beginning of time "\
+                            "block)".format(blockformat.grouptag))
+                blocksize = unpack_from(blockformat.sizeformat, header,
+                        blockformat.tagsize)[0]
+                blockoffset = f.tell()
+                buf = f.read(blocksize + headersize)
+                if len(buf) < blocksize:
+                    raise_runtime_error("End of time block")
+                blockbuf = memoryview(buf)[:blocksize]
+                (blockticks, channels) = parse_time_block(blockbuf,
+                        blockformat, ticks, blockoffset)
+                yield (blockticks, BlockInfo(mc_filepath, blockoffset,
+                        blocksize, channels), blockbuf)
+                header = buf[blocksize:]
+
+    @property
+    def _mcfile(self):
+        """
+        The .mc file of a 'OneFile' cache, checked on first access.
+        """
+
+        if self.__mc_filepath is None:
+            self.__mc_filepath = self._open_mcfile()
+
+        return self.__mc_filepath
+
+    @property
+    def _frame_files(self):
+        """
+        The .mc files of a 'OneFilePerFrame' cache (see '_find_frame_files'),
+        found on first access.
+        """
+
+        if self.__frame_files is None:
+            self.__frame_files = self._find_frame_files()
+
+        return self.__frame_files
+
+    def _mc_filepaths(self):
+        """
+        _mc_filepaths()
+
+            Returns the sorted list of all the .mc files of the cache.
+        """
+
+        if self.cachetype == "OneFile":
+            return [self._mcfile]
+
+        return [self._frame_files[t] for t in sorted(self._frame_files)]
+
+    def _iter_blocks(self):
+        """
+        _iter_blocks()
+
+            Walks over the time blocks of all the .mc files in time order
+            without building the index (see '_iter_mcfile').
+            Yields a (<time>, BlockInfo) tuple per block.
+        """
+
+        if self.cachetype == "OneFile":
+            for item in self._iter_mcfile(self._mcfile):
+                yield item
+            return
+        for ticks in sorted(self._frame_files):
+            for item in self._iter_mcfile(self._frame_files[ticks], ticks):
+                yield item
+
+    def _build_index(self):
+        """
+        _build_index()
+
+            Scans the .mc file(s) and returns the index. The files of a
+            'OneFilePerFrame' cache are scanned concurrently.
+        """
+
+        if self.cachetype == "OneFile":
+            return self._scan_mcfile(self._mcfile,
+                    use_block_reads=self.__use_block_reads)
+
+        index = dict()
+        for blocks in ordered_map(lambda item: self._scan_mcfile(*item,
+                        use_block_reads=self.__use_block_reads),
+                [(self._frame_files[t], t)
+                        for t in sorted(self._frame_files)],
+                self.__max_workers):
+            index.update(blocks)
+
+        return index
+
+    def _index_filepath(self):
+        (base, _) = os.path.splitext(self.__xmlfile)
+        return "".join((base, ".mcindex"))
+
+    def _mcfiles_key(self):
+        """
+        _mcfiles_key()
+
+            Returns the name, size and modification time of all the .mc
+            files. The index file is only valid if these didn't change.
+        """
+
+        mcfiles_key = []
+        for mc_filepath in self._mc_filepaths():
+            stat = os.stat(mc_filepath)
+            mcfiles_key.append([os.path.basename(mc_filepath),
+                    stat.st_size, stat.st_mtime])
+
+        return mcfiles_key
+
+    def _load_index_file(self):
+        """
+        _load_index_file()
+
+            Loads the index from the sidecar file next to the .xml file.
+            Returns None if there is no index file or if it is out of date
+            (the size or modification time of the .mc file(s) changed).
+        """
+
+        index_filepath = self._index_filepath()
+        if not os.path.isfile(index_filepath):
+            return None
+        try:
+            with open(index_filepath, "r") as f:
+                indexdata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if indexdata.get("version") != INDEX_VERSION:
+            return None
+        if indexdata.get("mcfiles") != self._mcfiles_key():
+            return None
+
+        directory = os.path.dirname(self.__xmlfile)
+        index = dict()
+        for (ticks, mc_filename, blockoffset, blocksize,
+                channels) in indexdata["blocks"]:
+            index[ticks] = BlockInfo(os.path.join(directory, mc_filename),
+                    blockoffset, blocksize,
+                    {ch: ChannelInfo(*info)
+                            for (ch, info) in channels.items()})
+
+        return index
+
+    def _write_index_file(self, index):
+        """
+        _write_index_file(index)
+
+            Stores the index in a sidecar file next to the .xml file. The
+            index is keyed by the size and modification time of the .mc
+            file(s), so it will be rebuilt when the cache changes.
+            Failing to write the file (e.g. a read only directory) is not an
+            error, the index is just not persisted.
+        """
+
+        indexdata = dict()
+        indexdata['version'] = INDEX_VERSION
+        indexdata['mcfiles'] = self._mcfiles_key()
+        indexdata['blocks'] = [(ticks, os.path.basename(block.filepath),
+                block.offset, block.size,
+                {ch: tuple(info) for (ch, info) in block.channels.items()})
+                for (ticks, block) in sorted(index.items())]
+        index_filepath = self._index_filepath()
+        tmp_filepath = "".join((index_filepath, ".tmp"))
+        try:
+            with open(tmp_filepath, "w") as f:
+                json.dump(indexdata, f)
+            os.replace(tmp_filepath, index_filepath)
+        except OSError:
+            pass
+
+    @property
+    def index(self):
+        """
+        The offset index of the cache, built on first access:
+        {<time1>: BlockInfo(filepath, offset, size,
+                            {<channel1>: ChannelInfo(offset, num_vertices,
+                                                     dataformat), ...}),
+         <time2>: ... etc.}
+        It can also be set to an index that was built elsewhere (e.g. by a
+        worker thread, for the same files).
+        """
+
+        if self.__index is None:
+            index = None
+            if self.__use_index_file:
+                index = self._load_index_file()
+            if index is None:
+                index = self._build_index()
+                if self.__use_index_file:
+                    self._write_index_file(index)
+            self.__index = index
+
+        return self.__index
+
+    @index.setter
+    def index(self, index):
+        self.__index = index
+
+    def num_vertices(self, channel):
+        """
+        num_vertices(channel)
+
+            Returns the number of vertices of 'channel' (in the first frame
+            that contains the channel) or None if the channel is not found.
+            Without an index only the headers of the time blocks up to the
+            first one with the channel are read (usually just the first
+            one), the index is not built.
+        """
+
+        if self.__index is not None:
+            blocks = (self.__index[t] for t in sorted(self.__index))
+        else:
+            blocks = (block for (_, block) in self._iter_blocks())
+        for block in blocks:
+            channelinfo = block.channels.get(channel)
+            if channelinfo is not None:
+                return channelinfo.num_vertices
+
+        return None
+
+    def _block_at(self, ticks):
+        """
+        _block_at(ticks)
+
+            Returns the BlockInfo at the time 'ticks' or None. For a
+            'OneFilePerFrame' cache without index only the file of that
+            frame is scanned.
+        """
+
+        if self.__index is None and self.cachetype == "OneFilePerFrame":
+            mc_filepath = self._frame_files.get(ticks)
+            if mc_filepath is None:
+                return None
+            return self._scan_mcfile(mc_filepath, ticks).get(ticks)
+
+        return self.index.get(ticks)
+
+    def _mmap(self, mc_filepath):
+        """
+        _mmap(mc_filepath)
+
+            Returns the (read only) memory map of the .mc file, the file is
+            mapped on first use.
+        """
+
+        # A live cache maps files from its prefetch thread and the main
+        # thread, so the same file must not be mapped twice.
+        with self.__mmaps_lock:
+            mcmap = self.__mmaps.get(mc_filepath)
+            if mcmap is None:
+                with open(mc_filepath, "rb") as f:
+                    mcmap = mmap.mmap(f.fileno(), 0,
+                            access=mmap.ACCESS_READ)
+                self.__mmaps[mc_filepath] = mcmap
+
+        return mcmap
+
+    def close(self):
+        """
+        close()
+
+            Closes the memory maps of the cache. A mapping that is still
+            referenced by returned arrays stays valid until these arrays are
+            deleted.
+        """
+
+        with self.__mmaps_lock:
+            for mcmap in self.__mmaps.values():
+                try:
+                    mcmap.close()
+                except BufferError:
+                    # Still exported to an array, it's freed with the array.
+                    pass
+            self.__mmaps.clear()
+
+    def _read_channel(self, f, block, channel, vertices=None, buf=None):
+        """
+        _read_channel(f, block, channel, vertices=None, buf=None)
+
+            Reads the data of 'channel' in the time block 'block'. When the
+            cache is memory mapped a NumPy array is returned, otherwise the
+            data is read from the open file 'f' and a generator with the
+            positions (as tuples per vertex) is returned.
+            If 'buf' is given (the whole time block, see 'read_blockbuffer')
+            a NumPy array over 'buf' is returned and nothing is read.
+            If 'vertices' is given (a stride or a sequence of vertex indices)
+            only the data of these vertices is read.
+        """
+
+        channelinfo = block.channels[channel]
+        if buf is not None:
+            vertexarray = view_vertexarray(buf, channelinfo._replace(
+                    offset=channelinfo.offset - block.offset))
+            if vertices is None:
+                return vertexarray
+            elif isinstance(vertices, int):
+                return vertexarray[::vertices]
+            return vertexarray[vertex_indices(vertices,
+                    channelinfo.num_vertices)]
+        if vertices is not None:
+            if self.__use_mmap and self.cachetype == "OneFile":
+                vertexarray = view_vertexarray(self._mmap(block.filepath),
+                        channelinfo)
+                if isinstance(vertices, int):
+                    # A strided view, still nothing is copied.
+                    return vertexarray[::vertices]
+                return vertexarray[vertex_indices(vertices,
+                        channelinfo.num_vertices)]
+            vertexarray = read_vertex_subset(f, channelinfo,
+                    vertex_indices(vertices, channelinfo.num_vertices))
+            if self.__use_mmap:
+                return vertexarray
+            return (tuple(v) for v in vertexarray.tolist())
+        if self.__use_mmap:
+            if self.cachetype == "OneFile":
+                return view_vertexarray(self._mmap(block.filepath),
+                        channelinfo)
+            # Mapping thousands of frame files would run out of file
+            # handles, so the data of a frame is read in a buffer.
+            return read_vertexbuffer(f, channelinfo)
+        vertexarray = read_vertexarray(f, channelinfo)
+
+        return (i for i in grouper(3, vertexarray))
+
+    def _use_block_buffer(self):
+        # A memory mapped 'OneFile' cache doesn't read anything at all.
+        return self.__use_block_reads and not (self.__use_mmap and
+                self.cachetype == "OneFile")
+
+    def _read_block(self, block, channels, f=None, vertices=None, buf=None):
+        """
+        _read_block(block, channels, f=None, vertices=None, buf=None)
+
+            Reads the given channels of the time block 'block'. If no open
+            file 'f' is given, the .mc file of the block is opened.
+            'vertices' is the vertex subset for all channels, or a dictionary
+            with the subset per channel (see 'iter_frames').
+            With block reads the whole block is read in one go, unless it
+            was already read in 'buf'.
+            Returns a dictionary with the channel as key and the vertex data
+            as value.
+        """
+
+        channels = [ch for ch in channels if ch in block.channels]
+        if isinstance(vertices, dict):
+            subsets = {ch: vertices.get(ch) for ch in channels}
+        else:
+            subsets = {ch: vertices for ch in channels}
+        if buf is None and channels and self._use_block_buffer():
+            buf = read_blockbuffer(block, f)
+        if buf is not None:
+            return {ch: self._read_channel(f, block, ch, subsets[ch], buf)
+                    for ch in channels}
+        if f is None:
+            with open(block.filepath, "rb") as f:
+                return {ch: self._read_channel(f, block, ch, subsets[ch])
+                        for ch in channels}
+
+        return {ch: self._read_channel(f, block, ch, subsets[ch])
+                for ch in channels}
+
+    def read_channel_at_time(self, **kwargs):
+        """
+        read_channel_at_time(**kwargs)
+
+            channel=None,
+            cachetime=None,
+            vertices=None,
+
+            Reads the channel at the specified time. Returns the list
+            of vertex positions (as tuples per vertex) at that time, or a
+            NumPy array of shape (num_vertices, 3) for a memory mapped cache
+            and with block reads.
+            If 'vertices' is given only these vertices are read, it can be a
+            stride (read every Nth vertex) or a sequence of vertex indices.
+            Returns None if no info is found (non existing channel or wrong
+            time).
+
+            The data is looked up in the offset index (see 'index'), so
+            this is a single seek and read.
+        """
+
+        # Get the keyword args, default to None if it's not given.
+        channel = kwargs.get("channel", None)
+        cachetime = kwargs.get("cachetime", None)
+        vertices = kwargs.get("vertices", None)
+        # Raise appropriate error if one of the keyword args is not given.
+        if not channel:
+            raise TypeError("read_channel() missing required keyword"\
+                    " argument: 'channel'")
+        if cachetime is None:
+            raise TypeError("read_channel() missing required keyword"\
+                    " argument: 'cachetime'")
+
+        block = self._block_at(cachetime)
+        if block is None or channel not in block.channels:
+            return None
+        vertexarray = self._read_block(block, [channel],
+                vertices=vertices)[channel]
+        if self.__use_mmap or self.__use_block_reads:
+            return vertexarray
+
+        return list(vertexarray)
+
+    def read_frame(self, **kwargs):
+        """
+        read_frame(**kwargs)
+
+            cachetime=None,
+            channels=self.channels,
+            vertices=None,
+
+            Reads the channel(s) at the specified time (see 'iter_frames'
+            for 'channels' and 'vertices').
+            Returns a dictionary with the channel as key and the vertex data
+            as value, or None if there is no data at that time.
+        """
+
+        cachetime = kwargs.get("cachetime", None)
+        channels = kwargs.get("channels", self.channels)
+        vertices = kwargs.get("vertices", None)
+        if cachetime is None:
+            raise TypeError("read_frame() missing required keyword"\
+                    " argument: 'cachetime'")
+
+        block = self._block_at(cachetime)
+        if block is None:
+            return None
+
+        return self._read_block(block, channels, vertices=vertices)
+
+    def iter_frames(self, **kwargs):
+        """
+        iter_frames(**kwargs)
+
+            channels=self.channels,
+            starttime=self.starttime,
+            endtime=self.endtime,
+            vertices=None,
+            step=1,
+
+            Reads the channel(s) in the specified timerange, one frame at a
+            time. If no channels are given, it will read all channels. If no
+            timerange is given it will use the timerange from the cache file.
+            With a 'step' of N only every Nth sample is read.
+            If 'vertices' is given only these vertices are read. It can be a
+            stride (read every Nth vertex), a sequence of vertex indices or a
+            dictionary with one of these per channel.
+            For a 'OneFilePerFrame' cache the next frame files are read
+            concurrently while the current frame is processed.
+            With block reads the next time block of a 'OneFile' cache is
+            read on a background thread while the current frame is
+            processed. If the index is not built yet, it is built from
+            these blocks on the way (see '_iter_frames_scanning'), so the
+            file is only read once.
+            Yields a (<time>, {<channel1>: <vertexarray1>, ... etc.}) tuple
+            per frame, in time order. Only the frames that are in progress
+            are kept in memory.
+            The vertexarrays are generators with the positions (as tuples
+            per vertex) or NumPy arrays for a memory mapped cache and with
+            block reads.
+        """
+
+        channels = kwargs.get("channels", self.channels)
+        starttime = kwargs.get("starttime", self.starttime)
+        endtime = kwargs.get("endtime", self.endtime)
+        vertices = kwargs.get("vertices", None)
+        step = kwargs.get("step", 1)
+
+        if (self.__index is None and self.cachetype == "OneFile" and
+                self._use_block_buffer()):
+            for frame in self._iter_frames_scanning(channels, starttime,
+                    endtime, vertices, step):
+                yield frame
+            return
+
+        index = self.index
+        times = [t for t in sorted(index) if starttime <= t <= endtime][::step]
+        if self.cachetype == "OneFile" and self._use_block_buffer():
+            blocks = [index[t] for t in times]
+            with open(self._mcfile, "rb") as f:
+                for (ticks, block, buf) in zip(times, blocks,
+                        read_ahead(lambda block: read_blockbuffer(block, f),
+                                blocks)):
+                    yield (ticks, self._read_block(block, channels, f,
+                            vertices, buf))
+        elif self.cachetype == "OneFile":
+            with open(self._mcfile, "rb") as f:
+                for ticks in times:
+                    yield (ticks, self._read_block(index[ticks], channels,
+                            f, vertices))
+        else:
+            channeldicts = ordered_map(
+                    lambda block: self._read_block(block, channels,
+                            vertices=vertices),
+                    [index[t] for t in times], self.__max_workers)
+            for (ticks, channeldict) in zip(times, channeldicts):
+                yield (ticks, channeldict)
+
+    def _iter_frames_scanning(self, channels, starttime, endtime,
+            vertices=None, step=1):
+        """
+        _iter_frames_scanning(channels, starttime, endtime, vertices=None,
+                              step=1)
+
+            'iter_frames' for a 'OneFile' cache with block reads and without
+            an index: the time blocks are read one after another (the next
+            one on a background thread, see 'iter_ahead') and the index is
+            built from them while the frames are yielded. The blocks of a
+            .mc file are in time order, so the frames are too. Blocks
+            outside the time range (or skipped by 'step') are only read for
+            the index. The index is kept when all blocks have been read.
+        """
+
+        index = dict()
+        num_times = 0
+        for (ticks, block, buf) in iter_ahead(
+                self._iter_mcfile_blocks(self._mcfile)):
+            index[ticks] = block
+            if not starttime <= ticks <= endtime:
+                continue
+            num_times += 1
+            if (num_times - 1) % step == 0:
+                yield (ticks, self._read_block(block, channels,
+                        vertices=vertices, buf=buf))
+        self.__index = index
+
+    def read_channels(self, **kwargs):
+        """
+        read_channels(**kwargs)
+
+            channels=self.channels,
+            starttime=self.starttime,
+            endtime=self.endtime,
+            vertices=None,
+
+            Reads the channel(s) in the specified timerange.
+            If no channels are given, it will read all channels. If no
+            timerange is given it will use the timerange from the cache file.
+            All frames are kept in memory, use 'iter_frames' to process the
+            frames one at a time.
+            The vertexarrays are generators with the positions (as tuples
+            per vertex) or NumPy arrays for a memory mapped cache.
+            Returns a dictionary:
+            {<time1>: {<channel1>: <vertexarray1>,
+                       <channel2>: <vertexarray2>, ... etc.},
+             <time2>: {channel1>: <vertexarray1>, ... etc.}
+            }
+        """
+
+        return dict(self.iter_frames(**kwargs))
+
+
+class MayaCacheWriter(object):
+    """
+    MayaCacheWriter(filepath, channels, starttime, endtime,
+                    timeperframe=250, cachetype="OneFile",
+                    dataformat="FVCA", cacheformat="mcc")
+
+        Writes a Maya Cache. 'filepath' is the .xml file, the .mc file(s)
+        (.mcx for the 64 bit 'mcx' cacheformat) are written next to it.
+        'channels' is a sequence of (channelname, num_vertices) pairs,
+        'starttime' and 'endtime' are the time range of the cache in ticks.
+        Use 'write_frame' to append the time blocks (in order) and 'close'
+        (or use it as a context manager) to finish the cache, the .xml file
+        is written last.
+        For the cachetype 'OneFilePerFrame' every call of 'write_frame'
+        writes a separate <name>Frame<N>[Tick<M>].mc file.
+    """
+
+    def __init__(self, filepath, channels, starttime, endtime,
+            timeperframe=250, cachetype="OneFile", dataformat="FVCA",
+            cacheformat="mcc"):
+        if cachetype not in ("OneFile", "OneFilePerFrame"):
+            raise ValueError("Cache type is unsupported type '{}', should "\
+                    "be 'OneFile' or 'OneFilePerFrame'.".format(cachetype))
+        if dataformat not in DATAFORMAT_SIZES:
+            raise ValueError("Wrong data format: {}".format(dataformat))
+        if cacheformat not in BLOCK_FORMATS:
+            raise ValueError("Cache format is unsupported format {}, should "\
+                    "be 'mcc' or 'mcx'.".format(cacheformat))
+        self.__xmlfile = filepath
+        (self.__base, _) = os.path.splitext(filepath)
+        self.__channels = [(channelname, int(num_vertices))
+                for (channelname, num_vertices) in channels]
+        self.__starttime = starttime
+        self.__endtime = endtime
+        self.__timeperframe = timeperframe
+        self.__cachetype = cachetype
+        self.__dataformat = dataformat
+        self.__dtype = ">f{}".format(DATAFORMAT_SIZES[dataformat])
+        self.__cacheformat = cacheformat
+        self.__blockformat = BLOCK_FORMATS[cacheformat]
+        self.__file = None
+        if cachetype == "OneFile":
+            self.__file = open("".join((self.__base,
+                    self.__blockformat.extension)), "wb")
+            self.__file.write(self._header(starttime, endtime))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _header(self, starttime, endtime):
+        """
+        _header(starttime, endtime)
+
+            Returns the header block of a data file.
+        """
+
+        blockformat = self.__blockformat
+        header = b"".join((pack_tag(b"CACH", blockformat),
+                pack_chunk(b"VRSN", b"0.1\0", blockformat),
+                pack_chunk(b"STIM", pack(">l", starttime), blockformat),
+                pack_chunk(b"ETIM", pack(">l", endtime), blockformat)))
+
+        return pack_group(header, blockformat)
+
+    def _block(self, ticks, vertexarrays):
+        """
+        _block(ticks, vertexarrays)
+
+            Returns the time block with the vertex data of all channels. The
+            blocks of a 'OneFilePerFrame' cache have no 'TIME' tag.
+        """
+
+        blockformat = self.__blockformat
+        block = bytearray(pack_tag(b"MYCH", blockformat))
+        if self.__cachetype == "OneFile":
+            block += pack_chunk(b"TIME", pack(">l", ticks), blockformat)
+        for (channelname, num_vertices) in self.__channels:
+            if channelname not in vertexarrays:
+                raise ValueError("No data for channel '{}'.".
+                        format(channelname))
+            data = np.asarray(vertexarrays[channelname], dtype=self.__dtype)
+            if data.size != num_vertices * 3:
+                raise ValueError("Channel '{}' has {} vertices, got {} "\
+                        "values.".format(channelname, num_vertices,
+                                data.size))
+            block += pack_chunk(b"CHNM", channelname.encode() + b"\0",
+                    blockformat)
+            block += pack_chunk(b"SIZE", pack(">l", num_vertices),
+                    blockformat)
+            block += pack_chunk(self.__dataformat.encode(), data.tobytes(),
+                    blockformat)
+
+        return pack_group(block, blockformat)
+
+    def write_frame(self, ticks, vertexarrays):
+        """
+        write_frame(ticks, vertexarrays)
+
+            Writes the time block for the time 'ticks'. 'vertexarrays' is a
+            dictionary with the channelname as key and the positions (a
+            flat sequence of x, y, z values or an array of shape
+            (num_vertices, 3)) as value. The block is written with a single
+            write.
+        """
+
+        block = self._block(ticks, vertexarrays)
+        if self.__cachetype == "OneFile":
+            self.__file.write(block)
+            return
+        (framenumber, tick) = divmod(ticks, self.__timeperframe)
+        mc_filepath = "".join((self.__base, "Frame{}".format(framenumber),
+                "Tick{}".format(tick) if tick else "",
+                self.__blockformat.extension))
+        with open(mc_filepath, "wb") as f:
+            f.write(b"".join((self._header(ticks, ticks), block)))
+
+    def _write_xmlfile(self):
+        """
+        _write_xmlfile()
+
+            Writes the .xml file describing the cache.
+        """
+
+        if self.__dataformat == "FVCA":
+            channeltype = "FloatVectorArray"
+        else:
+            channeltype = "DoubleVectorArray"
+        cache = ET.Element("Autodesk_Cache_File")
+        ET.SubElement(cache, "cacheType", Type=self.__cachetype,
+                Format=self.__cacheformat)
+        ET.SubElement(cache, "time", Range="{}-{}".format(self.__starttime,
+                self.__endtime))
+        ET.SubElement(cache, "cacheTimePerFrame",
+                TimePerFrame=str(self.__timeperframe))
+        ET.SubElement(cache, "cacheVersion", Version="2.0")
+        channels = ET.SubElement(cache, "Channels")
+        for (i, (channelname, _)) in enumerate(self.__channels):
+            ET.SubElement(channels, "channel{}".format(i),
+                    ChannelName=channelname,
+                    ChannelType=channeltype,
+                    ChannelInterpretation="positions",
+                    SamplingType="Regular",
+                    SamplingRate=str(self.__timeperframe),
+                    StartTime=str(self.__starttime),
+                    EndTime=str(self.__endtime))
+        ET.ElementTree(cache).write(self.__xmlfile, encoding="utf-8",
+                xml_declaration=True)
+
+    def close(self):
+        """
+        close()
+
+            Closes the .mc file and writes the .xml file.
+        """
+
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+        self._write_xmlfile()
+
+
+def scan_directory(directory, **kwargs):
+    """
+    scan_directory(directory, **kwargs)
+
+        Returns a MayaCache for every Maya Cache .xml file in 'directory',
+        sorted by name. Files that are not a (supported) Maya Cache are
+        skipped. Only the .xml files are read (and cached), so this is fast
+        enough to describe hundreds of caches. The keyword arguments are
+        passed on to MayaCache.
+    """
+
+    mayacaches = []
+    for filename in sorted(os.listdir(directory)):
+        if not os.path.splitext(filename)[-1].lower() == ".xml":
+            continue
+        try:
+            mayacaches.append(MayaCache(os.path.join(directory, filename),
+                    **kwargs))
+        except Exception:
+            # Not a (supported) Maya Cache file, skip it.
+            continue
+
+    return mayacaches
+
+
+def get_blockformat(grouptag):
+    """
+    get_blockformat(grouptag)
+
+        Returns the BlockFormat for the group tag ('FOR4' or 'FOR8') or None
+        if the tag is unknown.
+    """
+
+    for blockformat in BLOCK_FORMATS.values():
+        if blockformat.grouptag == grouptag:
+            return blockformat
+
+    return None
+
+
+def padded_size(size, alignment):
+    return size + (-size % alignment)
+
+
+def chunk_size(size, blockformat):
+    """
+    chunk_size(size, blockformat)
+
+        Returns the size in bytes of a chunk with 'size' bytes of data,
+        including the tag, the size and the padding of the data.
+    """
+
+    return (blockformat.tagsize + blockformat.sizesize +
+            padded_size(size, blockformat.alignment))
+
+
+def read_tag(f, blockformat):
+    """
+    read_tag(f, blockformat)
+
+        Reads a (padded) tag from the open file 'f'. Returns an empty string
+        at the end of the file.
+    """
+
+    return f.read(blockformat.tagsize)[:4].decode()
+
+
+def read_size(f, blockformat):
+    return unpack(blockformat.sizeformat, f.read(blockformat.sizesize))[0]
+
+
+def read_chunk_header(f, blockformat):
+    """
+    read_chunk_header(f, blockformat)
+
+        Reads the tag and the size of the data of a chunk from the open file
+        'f'. Returns them as a tuple.
+    """
+
+    tag = read_tag(f, blockformat)
+    if not tag:
+        raise_runtime_error("Chunk")
+
+    return (tag, read_size(f, blockformat))
+
+
+def read_value(f, size, blockformat):
+    """
+    read_value(f, size, blockformat)
+
+        Reads the data of a chunk with a single integer ('TIME' or 'SIZE')
+        from the open file 'f', including the padding.
+    """
+
+    if size == 4:
+        value = unpack(">l", f.read(4))[0]
+    elif size == 8:
+        value = unpack(">q", f.read(8))[0]
+    else:
+        raise ValueError("Unexpected size {} of an integer chunk".format(
+                size))
+    f.seek(padded_size(size, blockformat.alignment) - size, 1)
+
+    return value
+
+
+def pack_tag(tag, blockformat):
+    return tag.ljust(blockformat.tagsize, b"\0")
+
+
+def pack_chunk(tag, data, blockformat):
+    """
+    pack_chunk(tag, data, blockformat)
+
+        Returns a chunk: the (padded) tag, the size of 'data' and 'data'
+        padded out to the alignment of the file.
+    """
+
+    return b"".join((pack_tag(tag, blockformat),
+            pack(blockformat.sizeformat, len(data)), data,
+            b"\0" * (-len(data) % blockformat.alignment)))
+
+
+def pack_group(data, blockformat):
+    """
+    pack_group(data, blockformat)
+
+        Returns a group ('FOR4' or 'FOR8' block) with the chunks 'data'.
+    """
+
+    return b"".join((pack_tag(blockformat.grouptag.encode(), blockformat),
+            pack(blockformat.sizeformat, len(data)), bytes(data)))
+
+
+def unpack_chunk_header(buf, pos, blockformat):
+    """
+    unpack_chunk_header(buf, pos, blockformat)
+
+        Unpacks the tag and the size of the chunk at 'pos' in 'buf'.
+        Returns them with the position of the data of the chunk.
+    """
+
+    tag = bytes(buf[pos:pos + 4]).decode()
+    pos += blockformat.tagsize
+    size = unpack_from(blockformat.sizeformat, buf, pos)[0]
+
+    return (tag, size, pos + blockformat.sizesize)
+
+
+def unpack_value(buf, pos, size):
+    if size == 4:
+        return unpack_from(">l", buf, pos)[0]
+    elif size == 8:
+        return unpack_from(">q", buf, pos)[0]
+    raise ValueError("Unexpected size {} of an integer chunk".format(size))
+
+
+def parse_time_block(buf, blockformat, ticks=None, offset=0):
+    """
+    parse_time_block(buf, blockformat, ticks=None, offset=0)
+
+        Parses the headers of a time block (the contents of a FOR4 or FOR8
+        group) in the buffer 'buf' with 'unpack_from', nothing is copied.
+        'offset' is the position of 'buf' in the file, the offsets of the
+        channels are positions in the file. A block without a 'TIME' tag
+        gets the time 'ticks'.
+        Returns the time (in ticks) and the channels ({<channel>:
+        <ChannelInfo>}) of the block.
+    """
+
+    alignment = blockformat.alignment
+    if bytes(buf[:4]).decode() != "MYCH":
+        raise_runtime_error("'MYCH'")
+    pos = blockformat.tagsize
+    (tag, size, datapos) = unpack_chunk_header(buf, pos, blockformat)
+    if tag == "TIME":
+        ticks = unpack_value(buf, datapos, size)
+        pos = datapos + padded_size(size, alignment)
+    elif ticks is None:
+        raise_runtime_error("'TIME'")
+    channels = dict()
+    while pos < len(buf):
+        (tag, size, pos) = unpack_chunk_header(buf, pos, blockformat)
+        if tag != "CHNM":
+            raise_runtime_error("'CHNM'")
+        channelname = bytes(buf[pos:pos + size - 1]).decode()
+        pos += padded_size(size, alignment)
+        (tag, size, pos) = unpack_chunk_header(buf, pos, blockformat)
+        if tag != "SIZE":
+            raise_runtime_error("'SIZE'")
+        num_vertices = unpack_value(buf, pos, size)
+        pos += padded_size(size, alignment)
+        (dataformat, datasize, pos) = unpack_chunk_header(buf, pos,
+                blockformat)
+        check_datasize(dataformat, num_vertices, datasize)
+        channels[channelname] = ChannelInfo(offset + pos, num_vertices,
+                dataformat)
+        pos += padded_size(datasize, alignment)
+
+    return (ticks, channels)
+
+
+def read_blockbuffer(block, f=None):
+    """
+    read_blockbuffer(block, f=None)
+
+        Reads the whole time block 'block' with a single read from the open
+        file 'f' (or from the file of the block).
+    """
+
+    if f is None:
+        with open(block.filepath, "rb") as f:
+            return read_blockbuffer(block, f)
+    f.seek(block.offset)
+
+    return f.read(block.size)
+
+
+def check_datasize(dataformat, num_vertices, datasize):
+    """
+    check_datasize(dataformat, num_vertices, datasize)
+
+        Checks if the size of the data block matches the number of vertices
+        and the data format (FVCA for floats, DVCA for doubles).
+    """
+
+    if dataformat not in DATAFORMAT_SIZES:
+        raise ValueError("Wrong data format: {}".format(dataformat))
+    # num_vertices * 3 (x, y, z) * the size of a float or double should be
+    # the same as datasize.
+    if num_vertices * 3 * DATAFORMAT_SIZES[dataformat] != datasize:
+        raise ValueError("The datasize is not correct")
+
+
+def read_vertexarray(f, channelinfo):
+    """
+    read_vertexarray(f, channelinfo)
+
+        Reads the vertex data of a channel from the open .mc file 'f' at the
+        position stored in 'channelinfo'. Returns a flat array with the
+        x, y, z values in native byte order.
+    """
+
+    if channelinfo.dataformat == "FVCA":
+        vertexarray = array('f')
+    else:
+        vertexarray = array('d')
+    f.seek(channelinfo.offset)
+    vertexarray.fromfile(f, channelinfo.num_vertices * 3)
+    if sys.byteorder == "little":
+        vertexarray.byteswap()
+
+    return vertexarray
+
+
+def read_vertexbuffer(f, channelinfo):
+    """
+    read_vertexbuffer(f, channelinfo)
+
+        Reads the vertex data of a channel from the open .mc file 'f' at the
+        position stored in 'channelinfo' in a buffer. Returns a big endian
+        NumPy array of shape (num_vertices, 3) over this buffer.
+    """
+
+    f.seek(channelinfo.offset)
+    buf = f.read(channelinfo.num_vertices * 3 *
+            DATAFORMAT_SIZES[channelinfo.dataformat])
+
+    return view_vertexarray(buf, channelinfo._replace(offset=0))
+
+
+def vertex_indices(vertices, num_vertices):
+    """
+    vertex_indices(vertices, num_vertices)
+
+        Returns the vertex subset 'vertices' (a stride or a sequence of
+        vertex indices) as an array of indices and checks if all of them
+        are in range.
+    """
+
+    if isinstance(vertices, int):
+        return np.arange(0, num_vertices, vertices)
+    indices = np.asarray(vertices, dtype=np.int64)
+    if len(indices) and (indices.min() < 0 or
+            indices.max() >= num_vertices):
+        raise IndexError("Vertex index out of range, the channel has {} "\
+                "vertices.".format(num_vertices))
+
+    return indices
+
+
+def read_vertex_subset(f, channelinfo, indices):
+    """
+    read_vertex_subset(f, channelinfo, indices)
+
+        Reads the data of the vertices 'indices' of a channel from the open
+        .mc file 'f'. Only the ranges of the file that contain these vertices
+        are read (ranges with small gaps are combined into one read).
+        Returns a big endian NumPy array of shape (len(indices), 3).
+    """
+
+    dtype = np.dtype(">f{}".format(DATAFORMAT_SIZES[channelinfo.dataformat]))
+    vertexsize = 3 * dtype.itemsize
+    vertexarray = np.empty((len(indices), 3), dtype=dtype)
+    if not len(indices):
+        return vertexarray
+    order = np.argsort(indices, kind="mergesort")
+    sorted_indices = indices[order]
+    # Split the sorted indices in spans, a new span starts where the gap to
+    # the previous vertex is too big to just read over it.
+    max_gap = max(1, SUBSET_READ_GAP // vertexsize)
+    breaks = np.nonzero(np.diff(sorted_indices) > max_gap)[0] + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(sorted_indices)]))
+    for (start, end) in zip(starts, ends):
+        first = sorted_indices[start]
+        last = sorted_indices[end - 1]
+        f.seek(channelinfo.offset + first * vertexsize)
+        span = np.frombuffer(f.read((last - first + 1) * vertexsize),
+                dtype=dtype).reshape(-1, 3)
+        vertexarray[order[start:end]] = span[sorted_indices[start:end] -
+                first]
+
+    return vertexarray
+
+
+def view_vertexarray(buf, channelinfo):
+    """
+    view_vertexarray(buf, channelinfo)
+
+        Returns the vertex data of a channel as a big endian NumPy array of
+        shape (num_vertices, 3) directly over 'buf' (e.g. a memory map of the
+        .mc file), without copying or decoding anything.
+    """
+
+    if channelinfo.dataformat == "FVCA":
+        dtype = ">f4"
+    else:
+        dtype = ">f8"
+
+    return np.frombuffer(buf, dtype=dtype,
+            count=channelinfo.num_vertices * 3,
+            offset=channelinfo.offset).reshape(-1, 3)
+
+
+def native_vertices(vertexarray, dtype=np.float32):
+    """
+    native_vertices(vertexarray, dtype=np.float32)
+
+        Converts a (big endian) vertex array to a contiguous array of native
+        floats, e.g. to pass it to 'foreach_set'.
+    """
+
+    return np.ascontiguousarray(vertexarray, dtype=dtype)
+
+
+def ordered_map(function, iterable, max_workers=READ_WORKERS):
+    """
+    ordered_map(function, iterable, max_workers=READ_WORKERS)
+
+        Like 'map', but 'function' is called concurrently by a pool of
+        threads. The results are yielded in the order of 'iterable'. At most
+        2 * 'max_workers' items are in progress (or waiting to be consumed)
+        at the same time, so the memory use stays bounded.
+    """
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        pending = deque()
+        for item in iterable:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def read_ahead(function, iterable):
+    """
+    read_ahead(function, iterable)
+
+        Like 'map', but 'function' is already called for the next item on a
+        background thread while the result of the current item is used.
+        'function' is only called by that one thread.
+    """
+
+    with ThreadPoolExecutor(1) as executor:
+        pending = None
+        for item in iterable:
+            future = executor.submit(function, item)
+            if pending is not None:
+                yield pending.result()
+            pending = future
+        if pending is not None:
+            yield pending.result()
+
+
+def iter_ahead(iterable):
+    """
+    iter_ahead(iterable)
+
+        Yields the items of 'iterable', the next item is already taken from
+        it on a background thread while the current item is used. For
+        iterables that read sequentially, where 'read_ahead' can't be used.
+    """
+
+    iterator = iter(iterable)
+    end = object()
+    try:
+        with ThreadPoolExecutor(1) as executor:
+            pending = executor.submit(next, iterator, end)
+            while True:
+                item = pending.result()
+                if item is end:
+                    return
+                pending = executor.submit(next, iterator, end)
+                yield item
+    finally:
+        if hasattr(iterator, "close"):
+            iterator.close()
+
+
+def grouper(n, iterable, fillvalue=None):
+    args = [iter(iterable)] * n
+    return itertools.zip_longest(*args, fillvalue=fillvalue)
+
+
+def raise_cachefile_error(errno, filepath,
+        strerror="Maya Cache file not found"):
+    raise OSError(errno, strerror, filepath)
+
+
+def raise_runtime_error(tag):
+    raise RuntimeError("The cachefile seems corrupt."\
+            " {} tag not found".format(tag))
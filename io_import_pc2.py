@@ -23,7 +23,7 @@ bl_info = {
     "author": "Jasper van Nieuwenhuizen, Ivo Grigull, Matt Ebb,"\
               " Bill L. Nieuwendorp",
     "version": (0, 5),
-    "blender": (2, 5, 8),
+    "blender": (2, 7, 0),
     "location": "File > Import > Pointcache (.pc2)",
     "wiki_url": "http://wiki.blender.org/index.php/Extensions:2.6/Py/Scripts/Import-Export/PC2_Pointcache_import",
     "tracker_url": "http://projects.blender.org/tracker/index.php?func=detail&aid=28056&group_id=153&atid=467",
@@ -32,79 +32,223 @@ bl_info = {
 
 import bpy
 from bpy.props import (StringProperty,
+                       BoolProperty,
                        IntProperty,
                        )
 from bpy_extras.io_utils import ImportHelper
-from struct import unpack
-
-
-def pc2_import(filepath, ob, scene, PREF_OFFSET=0, PREF_JUMP=1):
+import math
+import mmap
+import os
+from struct import calcsize, unpack
+
+import numpy as np
+
+
+# Header of a .pc2 file: signature, file version, number of points, start
+# frame, sample rate and number of samples. The samples follow it, as 3
+# little endian floats per point.
+PC2_HEADER_FORMAT = '<12siiffi'
+PC2_HEADER_SIZE = calcsize(PC2_HEADER_FORMAT)
+PC2_SIGNATURE = b'POINTCACHE2\0'
+
+
+class Pc2File(object):
+    """
+    Pc2File(filepath)
+
+        A Point Cache 2 (.pc2) file. The header is checked (the signature
+        and the size of the file) and the samples are memory mapped.
+        Indexing returns the positions of a sample as a little endian
+        float32 NumPy array of shape (num_points, 3), a slice
+        (cache[a:b:step]) an array of shape (n, num_points, 3) and
+        cache[sample, first:last] a range of points. These are views on the
+        file, nothing is read or copied until the data is used.
+        Should be closed with 'close' (or used as a context manager).
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath, 'rb') as f:
+            header = f.read(PC2_HEADER_SIZE)
+            if len(header) < PC2_HEADER_SIZE:
+                raise ValueError('%s is not a .pc2 file' % filepath)
+            (signature, self.version, self.num_points, self.start_frame,
+                    self.sample_rate, self.num_samples) = unpack(
+                            PC2_HEADER_FORMAT, header)
+            if signature != PC2_SIGNATURE:
+                raise ValueError('%s is not a .pc2 file' % filepath)
+            if self.num_points < 0 or self.num_samples < 0:
+                raise ValueError('%s has an invalid header' % filepath)
+            datasize = self.num_points * self.num_samples * 12
+            filesize = os.fstat(f.fileno()).st_size
+            if filesize < PC2_HEADER_SIZE + datasize:
+                raise ValueError('%s is truncated: %d samples of %d points '
+                        'need %d bytes, the file has %d' % (filepath,
+                                self.num_samples, self.num_points,
+                                PC2_HEADER_SIZE + datasize, filesize))
+            self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__samples = np.frombuffer(self.__mmap, dtype='<f4',
+                count=self.num_samples * self.num_points * 3,
+                offset=PC2_HEADER_SIZE).reshape(self.num_samples,
+                        self.num_points, 3)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.num_samples
+
+    def __getitem__(self, key):
+        if self.__samples is None:
+            raise ValueError('I/O operation on closed file')
+        return self.__samples[key]
+
+    def close(self):
+        """
+        close()
+
+            Closes the memory map. A mapping that is still referenced by
+            returned arrays stays valid until these arrays are deleted.
+        """
+
+        self.__samples = None
+        try:
+            self.__mmap.close()
+        except BufferError:
+            # Still exported to an array, it's freed with the array.
+            pass
+
+
+def shape_keys_action(shape_keys):
+    """
+    shape_keys_action(shape_keys)
+
+        Returns the action of 'shape_keys', a new one is created if there is
+        none.
+    """
+
+    if shape_keys.animation_data is None:
+        shape_keys.animation_data_create()
+    action = shape_keys.animation_data.action
+    if action is None:
+        action = bpy.data.actions.new(name='%sAction' % shape_keys.name)
+        shape_keys.animation_data.action = action
+
+    return action
+
+
+def add_shape_key_fcurves(shape_keys, keys):
+    """
+    add_shape_key_fcurves(shape_keys, keys)
+
+        Builds the 'value' F-Curves of the key blocks directly in the action
+        of 'shape_keys', without changing frames or inserting keyframes one
+        by one. 'keys' is a list of (<key block>, [(frame, value), ...]).
+    """
+
+    action = shape_keys_action(shape_keys)
+    for (keyBlock, points) in keys:
+        fcurve = action.fcurves.new(keyBlock.path_from_id('value'))
+        fcurve.keyframe_points.add(len(points))
+        fcurve.keyframe_points.foreach_set('co',
+                [c for point in points for c in point])
+        fcurve.update()
+
+
+def pc2_samples(pc2, PREF_OFFSET=0, PREF_JUMP=1, PREF_RESAMPLE=False):
+    """
+    pc2_samples(pc2, PREF_OFFSET=0, PREF_JUMP=1, PREF_RESAMPLE=False)
+
+        Yields the samples of a Pc2File to import as (frame, name,
+        positions), one at a time. Sample i is placed at frame
+        'start_frame + i * sample_rate + PREF_OFFSET' and only every
+        PREF_JUMP-th sample is used; the others are never read from the
+        file.
+        With PREF_RESAMPLE the samples are interpolated (linearly) onto
+        every PREF_JUMP-th whole frame instead, for caches with subframe
+        samples. Only the two samples around such a frame are read and only
+        one interpolated sample is in memory at a time.
+    """
+
+    firstFrame = pc2.start_frame + PREF_OFFSET
+    if not (PREF_RESAMPLE and len(pc2) > 1 and pc2.sample_rate > 0):
+        for (i, sample) in zip(range(0, len(pc2), PREF_JUMP),
+                pc2[::PREF_JUMP]):
+            yield (firstFrame + i * pc2.sample_rate, 'frame_%.4d' % i,
+                    sample)
+        return
+
+    lastFrame = firstFrame + (len(pc2) - 1) * pc2.sample_rate
+    for frame in range(int(math.ceil(firstFrame)),
+            int(math.floor(lastFrame)) + 1, PREF_JUMP):
+        position = (frame - firstFrame) / pc2.sample_rate
+        i = min(int(position), len(pc2) - 2)
+        weight = position - i
+        if weight == 0.0:
+            sample = pc2[i]
+        else:
+            sample = pc2[i] * (1.0 - weight) + pc2[i + 1] * weight
+        yield (frame, 'frame_%.4d' % frame, sample)
+
+
+def pc2_import(filepath, ob, scene, PREF_OFFSET=0, PREF_JUMP=1,
+        PREF_RESAMPLE=False):
 
     print('\n\nimporting pointcache "%s"' % filepath)
 
     bpy.ops.object.mode_set(mode='OBJECT')
 
-    file = open(filepath, 'rb')
-
-    # Read info from the file header
-    headerFormat = '<12ciiffi'
-    header = unpack(headerFormat, file.read(32))
-
-    #fileVersion = header[12]
-    numPoints = header[13]
-    startFrame = int(header[14])
-    sampleRate = header[15]
-    numSamples = header[16]
-
-    print('\tnumPoints:%d startFrame:%d sampleRate:%d numSamples:%d'
-        % (numPoints, startFrame, sampleRate, numSamples))
-
-    # If target object doesn't have Basis shape key, create it.
-    try:
-        len(ob.data.shape_keys.key_blocks)
-    except:
-        ob.shape_key_add('Basis')
-        ob.data.update()
-
-    scene.frame_current = startFrame + PREF_OFFSET
-
-    def updateMesh(ob, fr):
-
-        # Insert new shape key.
-        #new_shapekey =
-        ob.shape_key_add('frame_%.4d' % fr)
-        #new_shapekey_name = new_shapekey.name
-
-        index = len(ob.data.shape_keys.key_blocks) - 1
-        ob.active_shape_key_index = index
-
-        shapeKeys = ob.data.shape_keys
-        verts = shapeKeys.key_blocks[index].data
-
-        for v in verts:
-            # 12 is the size of 3 floats
-            x, y, z = unpack('<3f', file.read(12))
-            v.co[:] = x, y, z
-
-        # Insert keyframes
-        scene.frame_current -= 1
-        shapeKeys.key_blocks[index].value = 0.0
-        shapeKeys.key_blocks[index].keyframe_insert('value')
-
-        scene.frame_current += 1
-        shapeKeys.key_blocks[index].value = 1.0
-        shapeKeys.key_blocks[index].keyframe_insert('value')
-
-        scene.frame_current += 1
-        shapeKeys.key_blocks[index].value = 0.0
-        shapeKeys.key_blocks[index].keyframe_insert('value')
-
-        ob.data.update()
-
-    for i in range(numSamples):
-        updateMesh(ob, i)
-
-    scene.frame_current = startFrame + PREF_OFFSET
+    with Pc2File(filepath) as pc2:
+        numPoints = pc2.num_points
+        startFrame = pc2.start_frame
+        sampleRate = pc2.sample_rate
+        numSamples = pc2.num_samples
+
+        print('\tnumPoints:%d startFrame:%g sampleRate:%g numSamples:%d'
+            % (numPoints, startFrame, sampleRate, numSamples))
+
+        if numPoints != len(ob.data.vertices):
+            raise ValueError('The cache has %d points, the mesh has %d '
+                    'vertices' % (numPoints, len(ob.data.vertices)))
+
+        # If target object doesn't have Basis shape key, create it.
+        try:
+            len(ob.data.shape_keys.key_blocks)
+        except:
+            ob.shape_key_add('Basis')
+            ob.data.update()
+
+        # Create all key blocks first...
+        frames = []
+        keyBlocks = []
+        for (frame, name, sample) in pc2_samples(pc2, PREF_OFFSET,
+                max(1, PREF_JUMP), PREF_RESAMPLE):
+            keyBlock = ob.shape_key_add(name)
+            # Set all coordinates of the sample in one go.
+            keyBlock.data.foreach_set('co',
+                    np.ascontiguousarray(sample, dtype=np.float32).ravel())
+            frames.append(frame)
+            keyBlocks.append(keyBlock)
+
+    # ...then animate them in one pass. Every key block is 1.0 on its own
+    # frame and 0.0 on the frames of the previous and next key blocks, so
+    # they blend into each other. The keyframes are written to the
+    # F-Curves directly, the current frame of the scene is never changed.
+    if keyBlocks:
+        if len(frames) > 1:
+            step = frames[1] - frames[0]
+        else:
+            step = 1.0
+        frames = [frames[0] - step] + frames + [frames[-1] + step]
+        add_shape_key_fcurves(ob.data.shape_keys, [(keyBlock,
+                [(frames[i], 0.0), (frames[i + 1], 1.0),
+                        (frames[i + 2], 0.0)])
+                for (i, keyBlock) in enumerate(keyBlocks)])
+    ob.active_shape_key_index = len(ob.data.shape_keys.key_blocks) - 1
+    ob.data.update()
 
     print('done')
 
@@ -131,6 +275,18 @@ class Import_pc2(bpy.types.Operator, ImportHelper):
             description="Amount of frames to offset the cache animation",
             min=minframe, max=maxframe, default=0,
             )
+    frameJump = IntProperty(
+            name="Sample step",
+            description="Import only every nth sample, the others are "\
+                        "skipped without reading them",
+            min=1, max=maxframe, default=1,
+            )
+    resample = BoolProperty(
+            name="Resample to frames",
+            description="Interpolate the samples onto whole frames, for "\
+                        "caches with subframe samples",
+            default=False,
+            )
     filename_ext = ".pc2"
     filter_glob = StringProperty(default="*.pc2", options={'HIDDEN'})
 
@@ -144,7 +300,8 @@ class Import_pc2(bpy.types.Operator, ImportHelper):
             raise Exception("filename not set")
 
         pc2_import(self.properties.filepath, context.active_object,
-                context.scene, self.properties.frameOffset)
+                context.scene, self.properties.frameOffset,
+                self.properties.frameJump, self.properties.resample)
 
         return {'FINISHED'}
 